@@ -0,0 +1,33 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from services.resilience.circuit_breaker import registered_circuit_breakers, CLOSED
+import logging
+
+
+health_router = APIRouter()
+
+
+@health_router.get("")
+async def health():
+    upstreams = {}
+    try:
+        for breaker in registered_circuit_breakers():
+            upstreams[breaker.name] = await breaker.status()
+    except Exception as e:
+        logging.error(e)
+        return JSONResponse(
+            content={
+                "status": "degraded",
+                "message": "Circuit state is unavailable",
+            },
+            status_code=200,
+        )
+
+    degraded = any(upstream["state"] != CLOSED for upstream in upstreams.values())
+    return JSONResponse(
+        content={
+            "status": "degraded" if degraded else "ok",
+            "upstreams": upstreams,
+        },
+        status_code=200,
+    )
@@ -3,25 +3,36 @@ from fastapi import Depends, status
 from fastapi.responses import JSONResponse
 from services.auth.user_service import UserService
 from services.auth.dependencies import RoleChecker
-from models.pydantic.reddit import RedditPostModel, RedditPostFormatForSubredditModel
+from models.pydantic.reddit import (
+    RedditPostModel,
+    RedditPostBatchModel,
+    RedditPostFormatForSubredditModel,
+    RedditPostFormatForSubredditsModel,
+)
 from starlette.responses import StreamingResponse
-#from services.ai.ollama.ollama_service import OllamaService
 from services.ai.utils import (
     stream_subreddits_suggestion_and_rules_formatted,
-    stream_openrouter_response,
+    stream_batch_suggestions,
+    stream_format_for_subreddits,
+    stream_formatted_post,
+    suggestion_mode,
+    create_suggestion_prompt,
+    ensure_llm_capacity,
+    format_post_prompt,
 )
 from services.ai.prompts import (
     create_subreddit_suggestion_prompt,
-    create_format_post_for_subreddit_prompt,
 )
+from services.ai.jobs import start_analysis_job, follow_analysis_job, analysis_job_exists
+from services.errors.ai_errors import AnalysisJobNotFound
+from services.sse.encoder import encode_sse, model_events, SSE_HEADERS
 from services.reddit.utils import get_subreddit_rules, subreddit_exists
-from api.utils import limiter
+from api.utils import limiter, cache_bypass_requested, stream_until_disconnected
 import re
 from fastapi import HTTPException
+from typing import Literal
 
 
-#ai_service = OllamaService()
-
 router = APIRouter()
 user_service = UserService()
 role_checker = RoleChecker(["admin", "user"])
@@ -29,30 +40,117 @@ role_checker = RoleChecker(["admin", "user"])
 
 @router.post("/suggest_subreddits")
 @limiter.limit("1/second")
-async def find_subreddit(request: Request, post_data: RedditPostModel, _ : bool = Depends(role_checker)):
-    prompt = create_subreddit_suggestion_prompt(post_data.post)
+async def find_subreddit(
+    request: Request,
+    post_data: RedditPostModel,
+    mode: Literal["fast", "llm", "hybrid"] = "llm",
+    _ : bool = Depends(role_checker),
+):
+    mode = suggestion_mode(mode)
+    prompt = await create_suggestion_prompt(post_data.post, mode)
+    use_cache = not cache_bypass_requested(request)
+    await ensure_llm_capacity([prompt], use_cache, post=post_data.post, mode=mode)
+
+    stream = stream_subreddits_suggestion_and_rules_formatted(
+        post_data.post,
+        prompt,
+        use_cache=use_cache,
+        mode=mode,
+    )
+
+    return StreamingResponse(
+        stream_until_disconnected(request, encode_sse(stream), "suggest_subreddits"),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+@router.post("/suggest_subreddits/batch")
+@limiter.limit("1/second")
+async def find_subreddits_batch(request: Request, batch: RedditPostBatchModel, _ : bool = Depends(role_checker)):
+    items = [(item.post, create_subreddit_suggestion_prompt(item.post)) for item in batch.posts]
+    use_cache = not cache_bypass_requested(request)
+    await ensure_llm_capacity([prompt for _, prompt in items], use_cache)
+
+    stream = stream_batch_suggestions(items, use_cache=use_cache)
 
     return StreamingResponse(
-        stream_subreddits_suggestion_and_rules_formatted(prompt),
-        media_type="text/event-stream"
+        stream_until_disconnected(request, encode_sse(stream), "suggest_subreddits_batch"),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+@router.post("/suggest_subreddits/jobs", status_code=status.HTTP_202_ACCEPTED)
+@limiter.limit("1/second")
+async def create_suggest_subreddits_job(
+    request: Request,
+    post_data: RedditPostModel,
+    mode: Literal["fast", "llm", "hybrid"] = "llm",
+    _ : bool = Depends(role_checker),
+):
+    mode = suggestion_mode(mode)
+    prompt = await create_suggestion_prompt(post_data.post, mode)
+    use_cache = not cache_bypass_requested(request)
+    await ensure_llm_capacity([prompt], use_cache, post=post_data.post, mode=mode)
+
+    job_id = await start_analysis_job(stream_subreddits_suggestion_and_rules_formatted(
+        post_data.post,
+        prompt,
+        use_cache=use_cache,
+        mode=mode,
+    ))
+
+    return {"job_id": job_id}
+
+@router.get("/jobs/{job_id}/events")
+@limiter.limit("5/second")
+async def get_job_events(request: Request, job_id: str, _ : bool = Depends(role_checker)):
+    if not await analysis_job_exists(job_id):
+        raise AnalysisJobNotFound()
+
+    stream = follow_analysis_job(job_id, request.headers.get("Last-Event-ID"))
+
+    return StreamingResponse(
+        stream_until_disconnected(request, stream, "job_events"),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
     )
 
 @router.post("/format_post")
 @limiter.limit("1/second")
 async def format_post(request: Request, data: RedditPostFormatForSubredditModel, _ : bool = Depends(role_checker)):
-    subreddit = data.subreddit_name.strip().strip("r/")
+    subreddit = data.subreddit_name.strip().removeprefix("r/")
     if not data.subreddit_rules:
-        print(subreddit)
-        if subreddit or await subreddit_exists(subreddit):
+        if subreddit and await subreddit_exists(subreddit):
             data.subreddit_rules = await get_subreddit_rules(subreddit)
         else:
-            return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Subreddit not found")
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Subreddit not found")
         
     if not data.subreddit_rules:
-        return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Subreddit has no rules")
-    prompt = create_format_post_for_subreddit_prompt(data.post, data.subreddit_name, data.subreddit_rules)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Subreddit has no rules")
+    use_cache = not cache_bypass_requested(request)
+    await ensure_llm_capacity([format_post_prompt(data.post, subreddit, data.subreddit_rules)], use_cache)
+    stream = stream_formatted_post(
+        data.post,
+        subreddit,
+        data.subreddit_rules,
+        use_cache=use_cache,
+    )
 
     return StreamingResponse(
-        stream_openrouter_response(prompt),
-        media_type="text/event-stream"
-    )
\ No newline at end of file
+        stream_until_disconnected(request, encode_sse(model_events(stream)), "format_post"),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+@router.post("/format_post/multi")
+@limiter.limit("1/second")
+async def format_post_for_subreddits(request: Request, data: RedditPostFormatForSubredditsModel, _ : bool = Depends(role_checker)):
+    subreddits = list(dict.fromkeys(name.strip().removeprefix("r/") for name in data.subreddit_names))
+
+    stream = stream_format_for_subreddits(data.post, subreddits, use_cache=not cache_bypass_requested(request))
+
+    return StreamingResponse(
+        stream_until_disconnected(request, encode_sse(stream), "format_post_multi"),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
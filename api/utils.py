@@ -1,7 +1,67 @@
+from fastapi import Request
+from services.metrics.metrics import SSE_CLIENT_DISCONNECTS
+from typing import AsyncGenerator
+import asyncio
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from core.config import settings
 
 
-limiter = Limiter(key_func=get_remote_address, storage_uri=settings.REDIS_URL)
\ No newline at end of file
+limiter = Limiter(key_func=get_remote_address, storage_uri=settings.REDIS_URL)
+
+
+CACHE_BYPASS_HEADER = "X-Bypass-Cache"
+
+
+def cache_bypass_requested(request: Request) -> bool:
+    return request.headers.get(CACHE_BYPASS_HEADER, "").lower() in ("1", "true", "yes")
+
+
+_STREAM_END = object()
+
+
+async def stream_until_disconnected(
+    request: Request,
+    stream: AsyncGenerator[str, None],
+    endpoint: str,
+) -> AsyncGenerator[str, None]:
+    """
+    Relays the stream to the client and closes it as soon as the client disconnects,
+    even while the stream is idle waiting for the model or Reddit.
+    Closing the stream cancels the upstream generation and pending rules fetches.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+    async def produce():
+        try:
+            async for chunk in stream:
+                await queue.put(chunk)
+        finally:
+            await stream.aclose()
+        await queue.put(_STREAM_END)
+
+    producer = asyncio.create_task(produce())
+    loop = asyncio.get_running_loop()
+    next_check = loop.time() + settings.SSE_DISCONNECT_POLL_INTERVAL
+    try:
+        while True:
+            try:
+                chunk = await asyncio.wait_for(queue.get(), timeout=max(next_check - loop.time(), 0))
+            except asyncio.TimeoutError:
+                chunk = None
+                if producer.done() and queue.empty():
+                    # Поток упал, не дойдя до конца — пробрасываем ошибку
+                    producer.result()
+                    return
+            if chunk is _STREAM_END:
+                return
+            if loop.time() >= next_check:
+                if await request.is_disconnected():
+                    SSE_CLIENT_DISCONNECTS.labels(endpoint=endpoint).inc()
+                    return
+                next_check = loop.time() + settings.SSE_DISCONNECT_POLL_INTERVAL
+            if chunk is not None:
+                yield chunk
+    finally:
+        producer.cancel()
@@ -0,0 +1,101 @@
+"""
+Per-request latency and memory of hashed TF-IDF matching against a memory-mapped
+catalog matrix, on a synthetic Zipf catalog like benchmarks.subreddit_catalog.
+
+    python -m benchmarks.catalog_vectors [--entries 100000] [--dim 512] [--queries 200] [--batch 16]
+"""
+from services.reddit.catalog_vectors import CatalogVectors, save_vectors, load_vectors
+import argparse
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+
+
+def percentile(values: list[float], q: float) -> float:
+    return sorted(values)[int(len(values) * q)]
+
+
+def rss_mib() -> dict[str, float]:
+    """Current anonymous and file-backed RSS; memory-mapped pages are file-backed and shared between workers."""
+    usage = {}
+    with open("/proc/self/status") as status:
+        for line in status:
+            name, _, value = line.partition(":")
+            if name in ("RssAnon", "RssFile"):
+                usage[name] = int(value.split()[0]) / 1024
+    return usage
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--post-words", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    words = [f"w{i}" for i in range(args.vocabulary)]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(args.vocabulary)))
+
+    def text(length: int) -> str:
+        return " ".join(rng.choices(words, cum_weights=cum_weights, k=length))
+
+    documents = [f"sub{i} {text(rng.randint(5, 40))}" for i in range(args.entries)]
+    posts = [text(args.post_words) for _ in range(args.queries)]
+
+    started = time.perf_counter()
+    built = CatalogVectors.build(documents, args.dim)
+    build_time = time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "vectors.npy")
+        save_vectors(path, built, "benchmark")
+        del built
+        rss_before = rss_mib()
+        vectors = load_vectors(path, "benchmark", args.entries, args.dim)
+
+        embed_timings, single_timings = [], []
+        for post in posts:
+            started = time.perf_counter()
+            query = vectors.embed([post])
+            embed_timings.append((time.perf_counter() - started) * 1e3)
+            started = time.perf_counter()
+            vectors.top_k(query, args.limit)
+            single_timings.append((time.perf_counter() - started) * 1e3)
+
+        batch_timings = []
+        for start in range(0, len(posts), args.batch):
+            queries = vectors.embed(posts[start:start + args.batch])
+            started = time.perf_counter()
+            vectors.top_k(queries, args.limit)
+            batch_timings.append((time.perf_counter() - started) * 1e3 / len(queries))
+
+        for name, timings in (
+            ("embed", embed_timings),
+            ("top-k", single_timings),
+            (f"top-k x{args.batch}", batch_timings),
+        ):
+            print(
+                f"{name:>12}: mean {statistics.mean(timings):.2f} ms, "
+                f"p50 {percentile(timings, 0.5):.2f} ms, p99 {percentile(timings, 0.99):.2f} ms per post"
+            )
+        matrix_mib = os.path.getsize(path) / 2**20
+        rss_after = rss_mib()
+        print(
+            f"{'matrix':>12}: {args.entries} x {args.dim} float32, {matrix_mib:.1f} MiB memory-mapped, built in {build_time:.1f} s"
+        )
+        print(
+            f"{'rss':>12}: anonymous +{rss_after['RssAnon'] - rss_before['RssAnon']:.1f} MiB, "
+            f"file-backed (shared) +{rss_after['RssFile'] - rss_before['RssFile']:.1f} MiB after lookups"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Tokens saved by compacting subreddit rules before they are put into the format prompt.
+
+    python -m benchmarks.prompt_budget [--corpus rules.json] [--limit 300]
+
+The corpus is a JSON list of rules strings as returned by get_subreddit_rules.
+The bundled benchmarks/data/synthetic_subreddit_rules.json is hand-written, not fetched
+from Reddit: it only shows the benchmark runs, and its savings say nothing about real
+subreddits. Measure on rules dumped from the rules cache in Redis instead.
+"""
+from services.ai.prompt_budget import count_tokens, compact_rules
+from pathlib import Path
+import argparse
+import json
+
+
+DEFAULT_CORPUS = Path(__file__).resolve().parent / "data" / "synthetic_subreddit_rules.json"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS)
+    parser.add_argument("--limit", type=int, default=300, help="description limit, AI_RULE_DESCRIPTION_MAX_CHARS")
+    args = parser.parse_args()
+
+    with open(args.corpus) as file:
+        corpus = json.load(file)
+
+    if args.corpus == DEFAULT_CORPUS:
+        print("Synthetic corpus: pass --corpus with real rules for meaningful savings")
+    total_raw = total_compact = 0
+    print(f"{'subreddit':<20} {'raw':>7} {'compact':>8} {'saved':>7}")
+    for rules in corpus:
+        raw = count_tokens(rules)
+        compact = count_tokens(compact_rules(rules, args.limit))
+        total_raw += raw
+        total_compact += compact
+        name = json.loads(rules).get("name", "?")
+        print(f"{name:<20} {raw:>7} {compact:>8} {1 - compact / raw:>7.1%}")
+    print(f"{'total':<20} {total_raw:>7} {total_compact:>8} {1 - total_compact / total_raw:>7.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Lookup latency and memory of SimHashIndex at 1M stored posts.
+
+    python -m benchmarks.simhash_index [--entries 1000000] [--lookups 10000] [--distance 4]
+"""
+from services.ai.simhash import SimHashIndex, simhash
+import argparse
+import random
+import statistics
+import resource
+import time
+
+
+def percentile(values: list[float], q: float) -> float:
+    return sorted(values)[int(len(values) * q)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=10_000)
+    parser.add_argument("--distance", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    fingerprints = [rng.getrandbits(64) for _ in range(args.entries)]
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    index = SimHashIndex(args.entries, args.distance)
+    for fingerprint in fingerprints:
+        index.add(fingerprint)
+    build_time = time.perf_counter() - started
+    # ru_maxrss is in KiB on Linux
+    index_memory = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) * 1024
+
+    def near(fingerprint: int) -> int:
+        for bit in rng.sample(range(64), rng.randint(0, args.distance)):
+            fingerprint ^= 1 << bit
+        return fingerprint
+
+    hits = [near(rng.choice(fingerprints)) for _ in range(args.lookups)]
+    misses = [rng.getrandbits(64) for _ in range(args.lookups)]
+
+    for name, queries in (("near-duplicate", hits), ("random", misses)):
+        timings = []
+        found = 0
+        for query in queries:
+            started = time.perf_counter()
+            found += index.find(query) is not None
+            timings.append((time.perf_counter() - started) * 1e6)
+        print(
+            f"{name:>15}: found {found}/{len(queries)}, "
+            f"mean {statistics.mean(timings):.1f} us, "
+            f"p50 {percentile(timings, 0.5):.1f} us, "
+            f"p99 {percentile(timings, 0.99):.1f} us"
+        )
+
+    post = "I've been trying to make money online for a while now but haven't had much success. " * 20
+    started = time.perf_counter()
+    for _ in range(100):
+        simhash(post)
+    print(f"{'simhash':>15}: {(time.perf_counter() - started) * 1e4:.1f} us per {len(post)}-char post")
+
+    print(f"{'index':>15}: {len(index)} entries, built in {build_time:.1f} s, ~{index_memory / 2**20:.1f} MiB RSS")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Candidate lookup latency and memory of SubredditCatalog on a synthetic catalog.
+Descriptions are drawn from a Zipf-distributed vocabulary, so common words have long
+posting lists like in real subreddit descriptions.
+
+    python -m benchmarks.subreddit_catalog [--entries 100000] [--vocabulary 50000] [--queries 1000]
+"""
+from services.reddit.catalog import CatalogEntry, SubredditCatalog
+import argparse
+import random
+import resource
+import statistics
+import time
+
+
+def percentile(values: list[float], q: float) -> float:
+    return sorted(values)[int(len(values) * q)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--post-words", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    words = [f"w{i}" for i in range(args.vocabulary)]
+    weights = [1 / (rank + 1) for rank in range(args.vocabulary)]
+
+    def text(length: int) -> str:
+        return " ".join(rng.choices(words, weights, k=length))
+
+    entries = [
+        CatalogEntry(f"sub{i}", text(rng.randint(5, 40)), rng.randint(0, 5_000_000), None)
+        for i in range(args.entries)
+    ]
+    posts = [text(args.post_words) for _ in range(args.queries)]
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    catalog = SubredditCatalog(entries)
+    build_time = time.perf_counter() - started
+    # ru_maxrss is in KiB on Linux
+    index_memory = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) * 1024
+
+    timings = []
+    for post in posts:
+        started = time.perf_counter()
+        catalog.candidates(post, args.limit)
+        timings.append((time.perf_counter() - started) * 1e3)
+    print(
+        f"{'candidates':>10}: {args.post_words}-word posts, "
+        f"mean {statistics.mean(timings):.2f} ms, "
+        f"p50 {percentile(timings, 0.5):.2f} ms, "
+        f"p99 {percentile(timings, 0.99):.2f} ms"
+    )
+    print(f"{'catalog':>10}: {len(catalog)} entries, built in {build_time:.1f} s, ~{index_memory / 2**20:.1f} MiB RSS")
+
+
+if __name__ == "__main__":
+    main()
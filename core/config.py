@@ -4,8 +4,31 @@ from dotenv import load_dotenv
 load_dotenv()
 
 class Settings(BaseSettings):
+    AI_BACKEND: str = "openrouter"
+    AI_PROVIDERS: str = ""
+    AI_ROUTER_WINDOW: int = 50
+    AI_ROUTER_ERROR_PENALTY: float = 10.0
+    AI_ROUTER_TTFT_PRIOR: float = 1.0
+    AI_ROUTER_EXPLORE_RATE: float = 0.05
+    AI_HEDGE_AFTER: float = 0.0
+    AI_STUB_RESPONSE: str = '{1 - r/test - "Local stub response" - 1.0}\n'
     AI_API_KEY: str
     AI_API_URL: str
+    AI_MODEL: str = "deepseek/deepseek-chat:free"
+    AI_HTTP2: bool = False
+    AI_HTTP_MAX_CONNECTIONS: int = 100
+    AI_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    AI_HTTP_KEEPALIVE_EXPIRY: float = 60.0
+    AI_HTTP_CONNECT_TIMEOUT: float = 5.0
+    AI_HTTP_READ_TIMEOUT: float = 30.0
+    AI_HTTP_WARMUP_CONNECTIONS: int = 2
+
+    OLLAMA_URL: str = "http://localhost:11434"
+    OLLAMA_MODEL: str = "deepseek-r1:1.5b"
+    OLLAMA_KEEP_ALIVE: str = "30m"
+    OLLAMA_TEMPERATURE: float = 0.0
+    OLLAMA_NUM_CTX: int = 4096
+    OLLAMA_NUM_PREDICT: int = 512
 
     REDDIT_CLIENT_ID: str
     REDDIT_CLIENT_SECRET: str
@@ -47,6 +70,88 @@ class Settings(BaseSettings):
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
 
+    SUBREDDIT_RULES_CACHE_TTL: int = 3600
+    SUBREDDIT_RULES_CACHE_STALE_TTL: int = 86400
+    SUBREDDIT_RULES_CACHE_FAILED_TTL: int = 60
+    SUBREDDIT_RULES_CACHE_LOCK_TTL: int = 15
+    AI_PROMPT_TOKEN_BUDGET: int = 6000
+    AI_PROMPT_TOKEN_BUDGETS: dict[str, int] = {}
+    AI_RULE_DESCRIPTION_MAX_CHARS: int = 300
+    AI_PROMPT_MIN_RULES_SHARE: float = 0.25
+
+    AI_RESPONSE_CACHE_TTL: int = 86400
+    AI_RESPONSE_CACHE_MAX_ENTRIES: int = 10000
+    AI_RESPONSE_CACHE_MAX_ENTRY_BYTES: int = 65536
+    AI_RESPONSE_CACHE_VERSION: str = "1"
+
+    CIRCUIT_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_RESET_TIMEOUT: float = 30.0
+    CIRCUIT_PROBE_TIMEOUT: float = 30.0
+    UPSTREAM_RETRY_ATTEMPTS: int = 3
+    UPSTREAM_RETRY_BASE_DELAY: float = 0.2
+    UPSTREAM_RETRY_MAX_DELAY: float = 2.0
+
+    REDDIT_RATE_LIMIT_PER_MINUTE: float = 100.0
+    REDDIT_RATE_LIMIT_BURST: int = 10
+    REDDIT_RATE_LIMIT_BACKGROUND_RESERVE: float = 0.2
+    REDDIT_RATE_LIMIT_MAX_WAIT: float = 5.0
+
+    SSE_DISCONNECT_POLL_INTERVAL: float = 0.5
+    SSE_FLUSH_INTERVAL: float = 0.05
+    SSE_FLUSH_BYTES: int = 512
+    SSE_HEARTBEAT_INTERVAL: float = 15.0
+
+    AI_MAX_CONCURRENT_STREAMS: int = 8
+    AI_ADMISSION_MAX_QUEUE: int = 50
+    AI_ADMISSION_MAX_WAIT: float = 60.0
+    AI_ADMISSION_LEASE_TTL: int = 30
+    AI_ADMISSION_POLL_INTERVAL: float = 0.25
+    AI_ADMISSION_RETRY_AFTER: int = 5
+
+    AI_INFLIGHT_SHARED: bool = False
+    AI_INFLIGHT_LOCK_TTL: int = 120
+    AI_INFLIGHT_REPLAY_TTL: int = 60
+    AI_INFLIGHT_IDLE_TIMEOUT: float = 30.0
+
+    AI_BATCH_CONCURRENCY: int = 3
+
+    AI_RULE_PRECHECK_ENABLED: bool = True
+    AI_FORMAT_EDITS_ENABLED: bool = True
+    AI_FORMAT_EDITS_MIN_CHARS: int = 600
+
+    AI_JOB_LEASE_TTL: int = 60
+    AI_JOB_RESULT_TTL: int = 3600
+
+    SIMILAR_POSTS_ENABLED: bool = True
+    SIMILAR_POSTS_MAX_DISTANCE: int = 4
+    SIMILAR_POSTS_MAX_ENTRIES: int = 1_000_000
+    SIMILAR_POSTS_SYNC_BATCH: int = 1000
+
+    SUBREDDIT_CATALOG_PATH: str = ""
+    SUBREDDIT_CATALOG_CANDIDATES: int = 20
+    SUBREDDIT_CATALOG_DESCRIPTION_MAX_CHARS: int = 120
+    SUBREDDIT_VECTORS_PATH: str = ""
+    SUBREDDIT_VECTORS_DIM: int = 512
+    SUBREDDIT_VECTORS_BATCH_WINDOW: float = 0.002
+    SUBREDDIT_VECTORS_MAX_BATCH: int = 32
+    SUBREDDIT_FAST_SUGGESTIONS: int = 5
+
+    SUBREDDIT_RULES_LOCAL_SIZE: int = 1024
+    SUBREDDIT_RULES_LOCAL_TTL: int = 60
+    SUBREDDIT_METADATA_STORE_PATH: str = ""
+    SUBREDDIT_METADATA_STORE_CHECK_INTERVAL: float = 5.0
+    SUBREDDIT_METADATA_STORE_REFRESH_INTERVAL: int = 900
+
+    SUBREDDIT_EXISTS_TTL: int = 86400
+    SUBREDDIT_MISSING_TTL: int = 300
+    SUBREDDIT_EXISTENCE_LOCAL_SIZE: int = 10000
+    SUBREDDIT_NAMES_PATH: str = ""
+    SUBREDDIT_NAMES_BLOOM_ERROR_RATE: float = 0.001
+    SUBREDDIT_NAMES_AUTHORITATIVE: bool = True
+
+    SUBREDDIT_RULES_CONCURRENCY: int = 4
+    SUBREDDIT_RULES_TIMEOUT: float = 8.0
+
     APP_NAME: str
     DOMAIN: str
 
@@ -1,5 +1,5 @@
 from fastapi import FastAPI
-from api.endpoints import reddit_analyzer, auth
+from api.endpoints import reddit_analyzer, auth, health
 from database.db import init_db
 from contextlib import asynccontextmanager
 from services.errors.main_errors import register_all_errors
@@ -9,13 +9,35 @@ from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from api.utils import limiter
 from services.reddit.utils import reddit
+from services.ai.http_client import start_ai_http_client, close_ai_http_client
+from services.ai.similar_posts import load_similar_posts_index
+from services.ai.utils import similar_posts_scope, LLM, HYBRID
+from services.reddit.catalog import load_subreddit_catalog
+from services.reddit.catalog_vectors import load_catalog_vectors
+from services.reddit.existence import load_subreddit_names
+from services.reddit.metadata_snapshot import start_metadata_store, close_metadata_store
+from services.ai.providers import start_ai_backend, close_ai_backend
+from services.ai.jobs import close_analysis_jobs
+from services.metrics.metrics import make_metrics_app, mark_metrics_process_dead
 
 VERSION = "1.0"
 
 @asynccontextmanager
 async def life_span(app: FastAPI):
+    await start_ai_http_client()
+    await start_ai_backend()
+    await load_subreddit_catalog()
+    await load_catalog_vectors()
+    await load_similar_posts_index([similar_posts_scope(mode) for mode in (LLM, HYBRID)])
+    await load_subreddit_names()
+    await start_metadata_store()
     yield
+    await close_metadata_store()
+    await close_analysis_jobs()
+    await close_ai_backend()
+    await close_ai_http_client()
     await reddit.close()
+    mark_metrics_process_dead()
 
 
 
@@ -36,4 +58,7 @@ app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 # Adding routers
 app.include_router(reddit_analyzer.router, prefix=f"/api/{VERSION}/reddit_analyzer")
-app.include_router(auth.auth_router, prefix=f"/api/{VERSION}/auth")
\ No newline at end of file
+app.include_router(auth.auth_router, prefix=f"/api/{VERSION}/auth")
+app.include_router(health.health_router, prefix=f"/api/{VERSION}/health")
+
+app.mount("/metrics", make_metrics_app())
\ No newline at end of file
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, field_validator
-from typing import Text, Optional
+from typing import Annotated, Text, Optional
 from .validators.reddit_validators import validate_text, validate_json
 
 
@@ -12,6 +12,9 @@ class RedditPostModel(BaseModel):
 
 
 
+class RedditPostBatchModel(BaseModel):
+    posts: list[RedditPostModel] = Field(min_length=1, max_length=20)
+
 
 class RedditPostFormatForSubredditModel(BaseModel):
     post: str = Field(min_length=2, max_length=10000)
@@ -28,4 +31,17 @@ class RedditPostFormatForSubredditModel(BaseModel):
     
     @field_validator("subreddit_rules")
     def validate_subreddit_rules(cls, value: str) -> str:
-        return validate_json(value, "subreddit_rules")
\ No newline at end of file
+        return validate_json(value, "subreddit_rules")
+
+
+class RedditPostFormatForSubredditsModel(BaseModel):
+    post: str = Field(min_length=2, max_length=10000)
+    subreddit_names: list[Annotated[str, Field(min_length=2, max_length=21)]] = Field(min_length=1, max_length=5)
+
+    @field_validator("post")
+    def validate_post(cls, value: str) -> str:
+        return validate_text(value)
+
+    @field_validator("subreddit_names")
+    def validate_subreddit_names(cls, value: list[str]) -> list[str]:
+        return [validate_text(name) for name in value]
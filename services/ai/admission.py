@@ -0,0 +1,189 @@
+from core.config import settings
+from database.redis import redis
+from services.metrics.metrics import AI_ADMISSION_REJECTED, AI_ADMISSION_WAIT_SECONDS
+from typing import AsyncGenerator, Callable
+import asyncio
+import json
+import logging
+import time
+import uuid
+
+
+# Очередь ожидающих и занятые слоты общие для всех воркеров.
+# Слоты выдаются в аренду и продлеваются, пока идёт генерация, поэтому
+# слот упавшего воркера освобождается сам по истечении AI_ADMISSION_LEASE_TTL.
+QUEUE_KEY = "llm_admission:queue"
+HEARTBEATS_KEY = "llm_admission:heartbeats"
+SEQUENCE_KEY = "llm_admission:sequence"
+SLOTS_KEY = "llm_admission:slots"
+
+QUEUE_EVENT_PREFIX = "event: queue\n"
+
+_CLEANUP = """
+local t = redis.call('time')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+redis.call('zremrangebyscore', KEYS[4], '-inf', now)
+local stale = redis.call('zrangebyscore', KEYS[2], '-inf', now - tonumber(ARGV[1]))
+for _, ticket in ipairs(stale) do
+    redis.call('zrem', KEYS[1], ticket)
+    redis.call('zrem', KEYS[2], ticket)
+end
+"""
+
+# KEYS: queue, heartbeats, sequence, slots; ARGV: stale_after, ticket, max_queue
+_ENQUEUE_SCRIPT = _CLEANUP + """
+if redis.call('zcard', KEYS[1]) >= tonumber(ARGV[3]) then
+    return -1
+end
+redis.call('zadd', KEYS[1], redis.call('incr', KEYS[3]), ARGV[2])
+redis.call('zadd', KEYS[2], now, ARGV[2])
+return redis.call('zrank', KEYS[1], ARGV[2])
+"""
+
+# KEYS: queue, heartbeats, sequence, slots; ARGV: stale_after, ticket, limit, lease_ttl
+# Returns -1 when the slot is acquired, -2 when the ticket was dropped, else the queue rank.
+_ACQUIRE_SCRIPT = _CLEANUP + """
+local rank = redis.call('zrank', KEYS[1], ARGV[2])
+if not rank then
+    return -2
+end
+if rank < tonumber(ARGV[3]) - redis.call('zcard', KEYS[4]) then
+    redis.call('zrem', KEYS[1], ARGV[2])
+    redis.call('zrem', KEYS[2], ARGV[2])
+    redis.call('zadd', KEYS[4], now + tonumber(ARGV[4]), ARGV[2])
+    return -1
+end
+redis.call('zadd', KEYS[2], now, ARGV[2])
+return rank
+"""
+
+# KEYS: slots; ARGV: ticket, lease_ttl
+_RENEW_SCRIPT = """
+local t = redis.call('time')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+return redis.call('zadd', KEYS[1], 'XX', now + tonumber(ARGV[2]), ARGV[1])
+"""
+
+_KEYS = (QUEUE_KEY, HEARTBEATS_KEY, SEQUENCE_KEY, SLOTS_KEY)
+
+
+def _stale_after() -> float:
+    # Ожидающий, который не опрашивал очередь несколько интервалов, считается ушедшим
+    return max(settings.AI_ADMISSION_POLL_INTERVAL * 20, 5)
+
+
+def queue_event(position: int) -> str:
+    return f"{QUEUE_EVENT_PREFIX}data: {json.dumps({'position': position})}\n\n"
+
+
+def is_queue_event(chunk: str) -> bool:
+    return chunk.startswith(QUEUE_EVENT_PREFIX)
+
+
+async def admission_queue_has_room() -> bool:
+    """Whether a new generation could join the admission queue now; True when Redis is unavailable."""
+    try:
+        waiting = await redis.zcard(QUEUE_KEY)
+    except Exception as e:
+        logging.error(e)
+        return True
+    return waiting < settings.AI_ADMISSION_MAX_QUEUE
+
+
+async def _enqueue(ticket: str) -> int:
+    return await redis.eval(
+        _ENQUEUE_SCRIPT, len(_KEYS), *_KEYS,
+        _stale_after(), ticket, settings.AI_ADMISSION_MAX_QUEUE,
+    )
+
+
+async def _try_acquire(ticket: str) -> int:
+    return await redis.eval(
+        _ACQUIRE_SCRIPT, len(_KEYS), *_KEYS,
+        _stale_after(), ticket, settings.AI_MAX_CONCURRENT_STREAMS, settings.AI_ADMISSION_LEASE_TTL,
+    )
+
+
+async def _keep_lease(ticket: str) -> None:
+    while True:
+        await asyncio.sleep(settings.AI_ADMISSION_LEASE_TTL / 3)
+        try:
+            await redis.eval(_RENEW_SCRIPT, 1, SLOTS_KEY, ticket, settings.AI_ADMISSION_LEASE_TTL)
+        except Exception as e:
+            logging.error(e)
+
+
+async def _release(ticket: str) -> None:
+    try:
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(SLOTS_KEY, ticket)
+            pipe.zrem(QUEUE_KEY, ticket)
+            pipe.zrem(HEARTBEATS_KEY, ticket)
+            await pipe.execute()
+    except Exception as e:
+        logging.error(e)
+
+
+async def stream_with_admission(
+    source_factory: Callable[[], AsyncGenerator[str, None]],
+) -> AsyncGenerator[str, None]:
+    """
+    Runs source_factory() once one of the AI_MAX_CONCURRENT_STREAMS cluster-wide slots is free.
+    While waiting yields queue events with the current position; if the queue is full
+    or the wait exceeds AI_ADMISSION_MAX_WAIT yields an error chunk instead.
+    The slot is released when the stream finishes or is closed.
+    """
+    ticket = uuid.uuid4().hex
+    started = time.monotonic()
+    try:
+        try:
+            rank = await _enqueue(ticket)
+        except Exception as e:
+            # Без Redis пропускаем запрос без ограничения, а не роняем сервис
+            logging.error(e)
+            async for chunk in source_factory():
+                yield chunk
+            return
+
+        if rank == -1:
+            AI_ADMISSION_REJECTED.labels(reason="queue_full").inc()
+            yield "Error: Service is busy, please try again later"
+            return
+
+        last_position = None
+        while True:
+            try:
+                rank = await _try_acquire(ticket)
+                requeued = rank == -2
+                if requeued:
+                    rank = await _enqueue(ticket)
+            except Exception as e:
+                # Redis пропал посреди ожидания — как и на входе, пропускаем без ограничения
+                logging.error(e)
+                break
+            if requeued:
+                if rank == -1:
+                    AI_ADMISSION_REJECTED.labels(reason="queue_full").inc()
+                    yield "Error: Service is busy, please try again later"
+                    return
+                continue
+            if rank == -1:
+                break
+            if time.monotonic() - started > settings.AI_ADMISSION_MAX_WAIT:
+                AI_ADMISSION_REJECTED.labels(reason="timeout").inc()
+                yield "Error: Service is busy, please try again later"
+                return
+            if rank + 1 != last_position:
+                last_position = rank + 1
+                yield queue_event(last_position)
+            await asyncio.sleep(settings.AI_ADMISSION_POLL_INTERVAL)
+
+        AI_ADMISSION_WAIT_SECONDS.observe(time.monotonic() - started)
+        lease = asyncio.create_task(_keep_lease(ticket))
+        try:
+            async for chunk in source_factory():
+                yield chunk
+        finally:
+            lease.cancel()
+    finally:
+        await _release(ticket)
@@ -0,0 +1,67 @@
+from array import array
+from collections import Counter, defaultdict
+from typing import Iterable
+import heapq
+import math
+import re
+
+
+_WORD = re.compile(r"\w+")
+
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has have i if in into is it its me my no not of on or "
+    "so that the their them there they this to was we were what when where which who will with you your "
+    "am been can could do does did just about any all some more most than then too very would should".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [word for word in _WORD.findall(text.lower()) if len(word) > 1 and word not in STOP_WORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an in-memory inverted index. For every posting the tf and
+    length-normalization part of the score is precomputed at build time, so a query
+    only sums idf * weight over the postings of its terms. Only the max_query_terms
+    rarest terms of a query are scored: they carry most of the signal and have the
+    shortest posting lists, which keeps long posts fast to look up.
+    """
+
+    def __init__(self, documents: Iterable[str], k1: float = 1.2, b: float = 0.75, max_query_terms: int = 32):
+        self.max_query_terms = max_query_terms
+        doc_ids: dict[str, array] = defaultdict(lambda: array("I"))
+        frequencies: dict[str, array] = defaultdict(lambda: array("H"))
+        lengths = array("I")
+        for doc_id, document in enumerate(documents):
+            tokens = tokenize(document)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                doc_ids[term].append(doc_id)
+                frequencies[term].append(min(tf, 0xFFFF))
+
+        self.size = len(lengths)
+        average_length = (sum(lengths) / self.size) if self.size else 0.0
+
+        self._postings: dict[str, tuple[array, array, float]] = {}
+        for term, ids in doc_ids.items():
+            weights = array("f", (
+                tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[doc_id] / average_length))
+                for doc_id, tf in zip(ids, frequencies.pop(term))
+            ))
+            df = len(ids)
+            idf = math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+            self._postings[term] = (ids, weights, idf)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def search(self, query: str, limit: int) -> list[tuple[int, float]]:
+        """Returns up to limit (doc_id, score) pairs, best first."""
+        terms = [self._postings[term] for term in set(tokenize(query)) if term in self._postings]
+        terms = heapq.nlargest(self.max_query_terms, terms, key=lambda postings: postings[2])
+        scores: dict[int, float] = defaultdict(float)
+        for ids, weights, idf in terms:
+            for doc_id, weight in zip(ids, weights):
+                scores[doc_id] += idf * weight
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
@@ -0,0 +1,123 @@
+from core.config import settings
+from services.metrics.metrics import AI_HTTP_POOL_CONNECTIONS, MULTIPROCESS
+import asyncio
+import httpx
+import logging
+
+
+_client: httpx.AsyncClient | None = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _create_client() -> httpx.AsyncClient:
+    http2 = settings.AI_HTTP2
+    if http2 and not _http2_available():
+        logging.warning("AI_HTTP2 is enabled but the h2 package is not installed, falling back to HTTP/1.1")
+        http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        event_hooks=_pool_stats_hooks(),
+        limits=httpx.Limits(
+            max_connections=settings.AI_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.AI_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.AI_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            settings.AI_HTTP_READ_TIMEOUT,
+            connect=settings.AI_HTTP_CONNECT_TIMEOUT,
+        ),
+    )
+
+
+async def _warm_up(client: httpx.AsyncClient) -> None:
+    """Opens keep-alive connections to the AI provider so the first requests skip TCP+TLS setup."""
+    origin = httpx.URL(settings.AI_API_URL).copy_with(path="/", query=None)
+
+    async def touch():
+        try:
+            await client.head(origin)
+        except httpx.HTTPError as e:
+            logging.warning(f"AI HTTP client warm-up failed: {e}")
+
+    await asyncio.gather(*(touch() for _ in range(settings.AI_HTTP_WARMUP_CONNECTIONS)))
+
+
+async def start_ai_http_client() -> None:
+    global _client
+    if _client is None:
+        _client = _create_client()
+    await _warm_up(_client)
+
+
+async def close_ai_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_ai_http_client() -> httpx.AsyncClient:
+    """
+    Returns the shared pooled client. It is created in main.life_span,
+    but is also created lazily for code running outside the app (celery, scripts).
+    """
+    global _client
+    if _client is None:
+        _client = _create_client()
+    return _client
+
+
+_POOL_STATES = ("connections", "idle", "active")
+
+
+def get_ai_http_pool_stats() -> dict[str, int]:
+    """
+    Connections in the shared client's pool. httpx doesn't expose the pool publicly,
+    so it is read from the httpcore transport; if those internals change, the stats are empty.
+    """
+    stats = dict.fromkeys(_POOL_STATES, 0)
+    if _client is None:
+        return stats
+    pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+    try:
+        for connection in getattr(pool, "connections", None) or []:
+            idle = getattr(connection, "is_idle", None)
+            if idle is None:
+                return dict.fromkeys(_POOL_STATES, 0)
+            stats["connections"] += 1
+            stats["idle" if idle() else "active"] += 1
+    except Exception as e:
+        logging.warning(f"Can't read the AI HTTP pool: {e}")
+        return dict.fromkeys(_POOL_STATES, 0)
+    return stats
+
+
+def _set_pool_gauges() -> None:
+    for state, value in get_ai_http_pool_stats().items():
+        AI_HTTP_POOL_CONNECTIONS.labels(state=state).set(value)
+
+
+def _pool_stats_hooks() -> dict[str, list]:
+    # В многопроцессном режиме set_function не экспортируется, поэтому гейджи обновляются на каждом запросе
+    if not MULTIPROCESS:
+        return {}
+
+    async def refresh(_) -> None:
+        _set_pool_gauges()
+
+    return {"request": [refresh], "response": [refresh]}
+
+
+if not MULTIPROCESS:
+    for _state in _POOL_STATES:
+        AI_HTTP_POOL_CONNECTIONS.labels(state=_state).set_function(
+            lambda state=_state: get_ai_http_pool_stats()[state]
+        )
@@ -0,0 +1,236 @@
+from core.config import settings
+from database.redis import redis
+from services.metrics.metrics import (
+    AI_COALESCED_STREAMS,
+    AI_CANCELLED_GENERATIONS,
+    AI_CANCELLED_GENERATION_CHUNKS,
+)
+from typing import AsyncGenerator, Awaitable, Callable
+import asyncio
+import logging
+import uuid
+
+
+INFLIGHT_STREAM_PREFIX = "ai_inflight:"
+INFLIGHT_LOCK_PREFIX = "ai_inflight_lock:"
+
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# ARGV: token, ttl in milliseconds
+_RENEW_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class InflightStream:
+    """
+    Fan-out buffer for one upstream stream. Every subscriber gets all chunks produced
+    so far and then the live tail. The upstream is cancelled once nobody listens.
+    """
+
+    def __init__(self, key: str, open_source: Callable[[], Awaitable[AsyncGenerator[str, None]]]):
+        self.key = key
+        self.chunks: list[str] = []
+        self.finished = False
+        self._updated = asyncio.Event()
+        self._subscribers = 0
+        self._task = asyncio.create_task(self._run(open_source))
+
+    async def _run(self, open_source: Callable[[], Awaitable[AsyncGenerator[str, None]]]) -> None:
+        source = None
+        try:
+            source = await open_source()
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(e)
+            self.chunks.append(f"Error: Request failed - {str(e)}")
+        finally:
+            if source is not None:
+                await source.aclose()
+            self.finished = True
+            self._notify()
+            if _inflight.get(self.key) is self:
+                del _inflight[self.key]
+
+    def _notify(self) -> None:
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def subscribe(self) -> AsyncGenerator[str, None]:
+        self._subscribers += 1
+        position = 0
+        try:
+            while True:
+                updated = self._updated
+                while position < len(self.chunks):
+                    yield self.chunks[position]
+                    position += 1
+                if self.finished:
+                    return
+                await updated.wait()
+        finally:
+            self._subscribers -= 1
+            if self._subscribers == 0 and not self.finished:
+                if _inflight.get(self.key) is self:
+                    del _inflight[self.key]
+                self._task.cancel()
+                AI_CANCELLED_GENERATIONS.inc()
+                AI_CANCELLED_GENERATION_CHUNKS.inc(len(self.chunks))
+
+
+_inflight: dict[str, InflightStream] = {}
+
+
+def _stream_key(key: str) -> str:
+    return f"{INFLIGHT_STREAM_PREFIX}{key}"
+
+
+def _lock_key(key: str) -> str:
+    return f"{INFLIGHT_LOCK_PREFIX}{key}"
+
+
+async def _keep_lock(key: str, token: str) -> None:
+    # Генерация может идти дольше AI_INFLIGHT_LOCK_TTL; без продления другой воркер начал бы её заново
+    while True:
+        await asyncio.sleep(settings.AI_INFLIGHT_LOCK_TTL / 3)
+        try:
+            renewed = await redis.eval(
+                _RENEW_LOCK_SCRIPT, 1, _lock_key(key), token, int(settings.AI_INFLIGHT_LOCK_TTL * 1000),
+            )
+        except Exception as e:
+            logging.error(e)
+            continue
+        if not renewed:
+            logging.warning(f"Lost the in-flight lock for {key}")
+            return
+
+
+async def _mirror_to_redis(key: str, token: str, source: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+    """
+    Passes the owner's chunks through and publishes them for followers in other workers.
+    The ownership lock is renewed while the stream runs.
+    """
+    stream_key = _stream_key(key)
+    lock = asyncio.create_task(_keep_lock(key, token))
+    try:
+        async for chunk in source:
+            try:
+                async with redis.pipeline(transaction=False) as pipe:
+                    pipe.xadd(stream_key, {"c": chunk})
+                    pipe.expire(stream_key, settings.AI_INFLIGHT_REPLAY_TTL)
+                    await pipe.execute()
+            except Exception as e:
+                logging.error(e)
+            yield chunk
+    finally:
+        lock.cancel()
+        await source.aclose()
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.xadd(stream_key, {"end": "1"})
+                pipe.expire(stream_key, settings.AI_INFLIGHT_REPLAY_TTL)
+                pipe.eval(_RELEASE_LOCK_SCRIPT, 1, _lock_key(key), token)
+                await pipe.execute()
+        except Exception as e:
+            logging.error(e)
+
+
+async def _follow_redis(
+    key: str,
+    source_factory: Callable[[], AsyncGenerator[str, None]],
+) -> AsyncGenerator[str, None]:
+    """
+    Replays and tails a stream owned by another worker. If the owner disappears
+    before producing anything, generates the response locally instead.
+    """
+    stream_key = _stream_key(key)
+    last_id = "0-0"
+    received = False
+    while True:
+        response = await redis.xread(
+            {stream_key: last_id},
+            block=int(settings.AI_INFLIGHT_IDLE_TIMEOUT * 1000),
+        )
+        if not response:
+            if await redis.exists(_lock_key(key)):
+                continue
+            break
+        for entry_id, fields in response[0][1]:
+            last_id = entry_id
+            if "end" in fields:
+                return
+            received = True
+            yield fields["c"]
+
+    if received:
+        yield "Error: Request failed - upstream stream was interrupted"
+        return
+    async for chunk in source_factory():
+        yield chunk
+
+
+async def _open_source(
+    key: str,
+    source_factory: Callable[[], AsyncGenerator[str, None]],
+) -> AsyncGenerator[str, None]:
+    if not settings.AI_INFLIGHT_SHARED:
+        return source_factory()
+
+    token = uuid.uuid4().hex
+    try:
+        acquired = await redis.set(_lock_key(key), token, nx=True, ex=settings.AI_INFLIGHT_LOCK_TTL)
+        if acquired:
+            await redis.delete(_stream_key(key))
+    except Exception as e:
+        logging.error(e)
+        return source_factory()
+
+    if acquired:
+        return _mirror_to_redis(key, token, source_factory())
+    AI_COALESCED_STREAMS.labels(scope="cluster").inc()
+    return _follow_redis(key, source_factory)
+
+
+async def coalesce_stream(
+    key: str,
+    source_factory: Callable[[], AsyncGenerator[str, None]],
+) -> AsyncGenerator[str, None]:
+    """
+    Streams source_factory() once per key: identical requests arriving while it is
+    in flight subscribe to the same upstream instead of opening their own.
+    With AI_INFLIGHT_SHARED the same happens across workers through a Redis Stream.
+    """
+    stream = _inflight.get(key)
+    if stream is None:
+        stream = InflightStream(key, lambda: _open_source(key, source_factory))
+        _inflight[key] = stream
+    else:
+        AI_COALESCED_STREAMS.labels(scope="worker").inc()
+
+    async for chunk in stream.subscribe():
+        yield chunk
+
+
+async def is_in_flight(key: str) -> bool:
+    """Whether coalesce_stream(key, ...) would join a running stream instead of starting one."""
+    if key in _inflight:
+        return True
+    if not settings.AI_INFLIGHT_SHARED:
+        return False
+    try:
+        return bool(await redis.exists(_lock_key(key)))
+    except Exception as e:
+        logging.error(e)
+        return False
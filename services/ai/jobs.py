@@ -0,0 +1,118 @@
+from core.config import settings
+from database.redis import redis
+from services.sse.encoder import SSEEvent, encode_sse, format_event, HEARTBEAT, ERROR
+from typing import AsyncGenerator
+import asyncio
+import logging
+import uuid
+
+
+JOB_STREAM_PREFIX = "ai_job:"
+JOB_STATUS_PREFIX = "ai_job_status:"
+
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+_jobs: set[asyncio.Task] = set()
+
+
+def _stream_key(job_id: str) -> str:
+    return f"{JOB_STREAM_PREFIX}{job_id}"
+
+
+def _status_key(job_id: str) -> str:
+    return f"{JOB_STATUS_PREFIX}{job_id}"
+
+
+async def _run_job(job_id: str, events: AsyncGenerator[SSEEvent, None]) -> None:
+    """
+    Writes the framed events to the job's Redis Stream. Entry ids are the SSE ids
+    assigned by encode_sse, so a client's Last-Event-ID is also its read position.
+    The status key works as a lease: it expires if this worker dies mid-job.
+    """
+    stream_key = _stream_key(job_id)
+    status_key = _status_key(job_id)
+    event_id = 1
+    status = FAILED
+    error = "Error: Job was interrupted"
+    try:
+        async for frame in encode_sse(events, first_id=event_id):
+            async with redis.pipeline(transaction=False) as pipe:
+                if frame != HEARTBEAT:
+                    pipe.xadd(stream_key, {"f": frame}, id=f"{event_id}-0")
+                    pipe.expire(stream_key, settings.AI_JOB_RESULT_TTL)
+                    event_id += 1
+                pipe.expire(status_key, settings.AI_JOB_LEASE_TTL)
+                await pipe.execute()
+        status = COMPLETED
+    except Exception as e:
+        logging.error(e)
+        error = f"Error: Request failed - {str(e)}"
+    finally:
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                if status != COMPLETED:
+                    pipe.xadd(stream_key, {"f": format_event(ERROR, error, event_id)}, id=f"{event_id}-0")
+                pipe.xadd(stream_key, {"end": "1"})
+                pipe.expire(stream_key, settings.AI_JOB_RESULT_TTL)
+                pipe.set(status_key, status, ex=settings.AI_JOB_RESULT_TTL)
+                await pipe.execute()
+        except Exception as e:
+            logging.error(e)
+
+
+async def start_analysis_job(events: AsyncGenerator[SSEEvent, None]) -> str:
+    """
+    Runs the event stream detached from the request in this worker and returns
+    the job id. Its output can be read with follow_analysis_job until AI_JOB_RESULT_TTL.
+    """
+    job_id = uuid.uuid4().hex
+    await redis.set(_status_key(job_id), RUNNING, ex=settings.AI_JOB_LEASE_TTL)
+    task = asyncio.create_task(_run_job(job_id, events))
+    _jobs.add(task)
+    task.add_done_callback(_jobs.discard)
+    return job_id
+
+
+async def analysis_job_exists(job_id: str) -> bool:
+    return bool(await redis.exists(_status_key(job_id)))
+
+
+def _stream_position(last_event_id: str | None) -> str:
+    if last_event_id is not None and last_event_id.strip().isdigit():
+        return f"{int(last_event_id)}-0"
+    return "0-0"
+
+
+async def follow_analysis_job(job_id: str, last_event_id: str | None = None) -> AsyncGenerator[str, None]:
+    """
+    Replays the job's SSE frames after last_event_id and then tails them until the job ends.
+    Reading does not affect the job, so clients can detach and re-attach at any time.
+    """
+    stream_key = _stream_key(job_id)
+    position = _stream_position(last_event_id)
+    while True:
+        response = await redis.xread(
+            {stream_key: position},
+            block=int(settings.SSE_HEARTBEAT_INTERVAL * 1000),
+        )
+        if not response:
+            if not await redis.exists(_status_key(job_id)):
+                yield format_event(ERROR, "Error: Job was interrupted")
+                return
+            yield HEARTBEAT
+            continue
+        for entry_id, fields in response[0][1]:
+            position = entry_id
+            if "end" in fields:
+                return
+            yield fields["f"]
+
+
+async def close_analysis_jobs() -> None:
+    """Cancels the jobs running in this worker; their readers get an end marker."""
+    for task in list(_jobs):
+        task.cancel()
+    if _jobs:
+        await asyncio.gather(*_jobs, return_exceptions=True)
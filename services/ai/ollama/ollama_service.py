@@ -1,31 +1,46 @@
-from ollama import Client
-import asyncio
+from ollama import AsyncClient, ResponseError
+from typing import AsyncGenerator
+import httpx
+import logging
 
 
 class OllamaService:
     def __init__(self,
                  address: str = "http://localhost:11434",
-                 model: str = "deepseek-r1:1.5b"):
-        self._address = address
+                 model: str = "deepseek-r1:1.5b",
+                 keep_alive: str = "30m",
+                 options: dict | None = None):
         self._model = model
+        self._keep_alive = keep_alive
+        self._options = options or {}
+        # Транспорт принадлежит сервису: так соединения с Ollama переиспользуются,
+        # а закрыть их можно без обращения к внутренностям AsyncClient
+        self._transport = httpx.AsyncHTTPTransport()
+        self._client = AsyncClient(host=address, transport=self._transport)
 
-    async def get_chat_stream(self, query: str):
-        client = Client(host=self._address)
+    async def preload(self) -> None:
+        """Loads the model into memory so the first request doesn't wait for it."""
+        try:
+            await self._client.generate(model=self._model, prompt="", keep_alive=self._keep_alive)
+        except (ResponseError, httpx.HTTPError, ConnectionError) as e:
+            # ollama превращает отказ в соединении во встроенный ConnectionError; запуск приложения продолжаем
+            logging.warning(f"Ollama model preload failed: {e}")
+
+    async def close(self) -> None:
+        await self._transport.aclose()
+
+    async def get_chat_stream(self, query: str) -> AsyncGenerator[str, None]:
         chat_messages: list[dict[str, str]] = [{'role': 'user', 'content': query}]
 
-        stream = client.chat(
+        stream = await self._client.chat(
             model=self._model,
             messages=chat_messages,
             stream=True,
-            options={
-                "temperature": 2,  # Deterministic output for speed
-                "num_ctx": 4096,     # Reasonable context length
-                "num_predict": 512   # Limit max tokens for faster response
-            }
+            keep_alive=self._keep_alive,
+            options=self._options,
         )
 
-        for chunk in stream:
+        async for chunk in stream:
             token = chunk['message']['content']
-            yield token
-            await asyncio.sleep(0.05)
-            
\ No newline at end of file
+            if token:
+                yield token
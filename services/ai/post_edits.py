@@ -0,0 +1,81 @@
+from dataclasses import dataclass
+import re
+
+
+# {title - "New title"}
+_TITLE = re.compile(r'\{\s*title\s*-\s*"(?P<text>.*?)"\s*\}', re.DOTALL)
+# {body - "Whole body"} — модель проигнорировала режим правок и переписала пост целиком
+_BODY = re.compile(r'\{\s*body\s*-\s*"(?P<text>.*?)"\s*\}', re.DOTALL)
+# {replace - "original fragment" - "new fragment"}
+_REPLACE = re.compile(r'\{\s*replace\s*-\s*"(?P<old>.*?)"\s*-\s*"(?P<new>.*?)"\s*\}', re.DOTALL)
+# {delete - "original fragment"}
+_DELETE = re.compile(r'\{\s*delete\s*-\s*"(?P<old>.*?)"\s*\}', re.DOTALL)
+# {score - 0.9}
+_SCORE = re.compile(r'\{\s*score\s*-\s*(?P<score>\d+(?:\.\d+)?)\s*\}')
+
+
+class PostEditError(ValueError):
+    """The model's edits can't be applied to the original post"""
+
+    pass
+
+
+@dataclass
+class FormattedPost:
+    title: str
+    body: str
+    score: float
+
+    def render(self) -> list[str]:
+        """The post in the format_post_for_subreddit_example.txt layout, one entry per chunk."""
+        return [
+            '{title - "' + self.title + '"}\n\n',
+            '{body - "' + self.body + '"}\n\n',
+            "{score - " + f"{self.score:g}" + "}",
+        ]
+
+
+def _locate(original: str, fragment: str) -> tuple[int, int]:
+    # Пробелы и переносы модель часто воспроизводит неточно, поэтому сравниваем без их учёта
+    words = fragment.split()
+    if not words:
+        raise PostEditError("Empty fragment")
+    matches = list(re.finditer(r"\s+".join(map(re.escape, words)), original))
+    if len(matches) != 1:
+        raise PostEditError(f"Fragment found {len(matches)} times: {fragment[:40]!r}")
+    return matches[0].span()
+
+
+def apply_post_edits(original: str, response: str) -> FormattedPost:
+    """
+    Rebuilds the formatted post from an edits response (see format_post_edits_example.txt).
+    Every edited fragment must occur in the original exactly once and edits must not overlap,
+    otherwise PostEditError is raised and the caller should ask for a full rewrite.
+    """
+    title = _TITLE.search(response)
+    score = _SCORE.search(response)
+    if title is None or score is None:
+        raise PostEditError("Missing title or score")
+
+    body = _BODY.search(response)
+    if body is not None:
+        return FormattedPost(title["text"], body["text"], float(score["score"]))
+
+    edits = [(match["old"], match["new"]) for match in _REPLACE.finditer(response)]
+    edits += [(match["old"], "") for match in _DELETE.finditer(response)]
+    spans = sorted((*_locate(original, old), new) for old, new in edits)
+
+    parts = []
+    position = 0
+    for start, end, new in spans:
+        if start < position:
+            raise PostEditError("Overlapping edits")
+        parts.append(original[position:start])
+        parts.append(new)
+        position = end
+    parts.append(original[position:])
+
+    formatted = "".join(parts).strip()
+    if not formatted:
+        raise PostEditError("Edits removed the whole post")
+    return FormattedPost(title["text"], formatted, float(score["score"]))
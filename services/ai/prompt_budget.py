@@ -0,0 +1,92 @@
+import json
+import re
+
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_MARKDOWN_LINK = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Approximate BPE token count: punctuation is one token, and words take
+    one token per ~4 characters. Close enough to budget prompts without a tokenizer.
+    """
+    return sum((len(piece) + 3) // 4 for piece in _TOKEN.findall(text))
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    if budget <= 0:
+        return ""
+    if count_tokens(text) <= budget:
+        return text
+    used = 0
+    for match in _TOKEN.finditer(text):
+        used += (len(match.group()) + 3) // 4
+        if used > budget:
+            return text[:match.start()].rstrip()
+    return text
+
+
+def _clean(text: str) -> str:
+    return _WHITESPACE.sub(" ", _MARKDOWN_LINK.sub(r"\1", text or "")).strip()
+
+
+def _compact_description(description: str, short_name: str, seen: set[str], limit: int | None) -> str:
+    kept = []
+    for sentence in _SENTENCE_END.split(_clean(description)):
+        key = sentence.lower().rstrip(".!? ")
+        # Повторы названия правила и шаблонные фразы, встречавшиеся в других правилах, выкидываем
+        if not key or key == short_name.lower() or key in seen:
+            continue
+        seen.add(key)
+        kept.append(sentence)
+    compact = " ".join(kept)
+    if limit is not None and len(compact) > limit:
+        compact = compact[:limit].rsplit(" ", 1)[0] + "…"
+    return compact
+
+
+def compact_rules(subreddit_rules: str, description_limit: int | None = None) -> str:
+    """
+    Turns the rules JSON from get_subreddit_rules into numbered plain-text lines:
+    drops empty descriptions and fields the model doesn't need, removes sentences
+    repeated across rules and truncates descriptions to description_limit characters.
+    Rules in any other JSON shape are only minified.
+    """
+    try:
+        data = json.loads(subreddit_rules)
+    except ValueError:
+        return _clean(subreddit_rules)
+    if not isinstance(data, dict) or not isinstance(data.get("rules"), list):
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+    seen: set[str] = set()
+    lines = []
+    for idx, rule in enumerate(data["rules"]):
+        if not isinstance(rule, dict):
+            continue
+        short_name = _clean(rule.get("short_name", ""))
+        number = rule.get("rule_number", idx + 1)
+        if description_limit == 0:
+            description = ""
+        else:
+            description = _compact_description(rule.get("description", ""), short_name, seen, description_limit)
+        lines.append(f"{number}. {short_name}: {description}" if description else f"{number}. {short_name}")
+    return "\n".join(lines)
+
+
+def fit_rules(subreddit_rules: str, budget: int, description_limit: int) -> str:
+    """
+    Compacts the rules and then, while they are over budget, shortens descriptions,
+    drops them and finally drops the last rules.
+    """
+    for limit in (description_limit, description_limit // 2, 0):
+        rules = compact_rules(subreddit_rules, limit)
+        if count_tokens(rules) <= budget:
+            return rules
+    lines = rules.split("\n")
+    while lines and count_tokens("\n".join(lines)) > budget:
+        lines.pop()
+    return "\n".join(lines)
@@ -1,4 +1,9 @@
+from core.config import settings
 from pathlib import Path
+from services.ai.prompt_budget import count_tokens, truncate_to_tokens, fit_rules, compact_rules
+from services.ai.providers import active_model
+from services.errors.ai_errors import PostTooLong
+from services.reddit.catalog import CatalogEntry, subreddit_candidates
 
 BASE_DIR = Path(__file__).resolve().parent
 BASE_EXAMPLES_DIR = Path(BASE_DIR, "prompts_examples")
@@ -9,33 +14,91 @@ with open(Path(BASE_EXAMPLES_DIR, "suggest_subreddit_example.txt")) as file:
 with open(Path(BASE_EXAMPLES_DIR, "format_post_for_subreddit_example.txt")) as file:
     format_post_for_subreddit_example = file.read()
 
+with open(Path(BASE_EXAMPLES_DIR, "format_post_edits_example.txt")) as file:
+    format_post_edits_example = file.read()
 
-def create_subreddit_suggestion_prompt(post: str):
+
+# Статичные инструкции идут первыми и не меняются между запросами,
+# чтобы провайдер мог переиспользовать закешированный префикс промпта.
+SUBREDDIT_SUGGESTION_INSTRUCTIONS = (
+    "You are a Reddit expert. Analyze the Reddit post below and suggest 3-5 relevant subreddits where it could be posted.\n"
+    "Focus on the topic, tone, and content.\n"
+    "Return reponse in such format, do not add anything else:\n{"
+    f"{suggest_subreddit_example}" + "}\n"
+)
+
+FORMAT_POST_INSTRUCTIONS = (
+    "You are a Reddit expert. Analyze the Reddit post below and format it according subreddit rules.\n"
+    "Focus on the topic, tone, and content.\n"
+    "Return reponse in such format, do not add anything else:\n{"
+    f"{format_post_for_subreddit_example}" + "}\n"
+)
+
+FORMAT_POST_EDITS_INSTRUCTIONS = (
+    "You are a Reddit expert. Analyze the Reddit post below and format it according subreddit rules.\n"
+    "Focus on the topic, tone, and content.\n"
+    "Return only the edits to the post in such format, do not add anything else:\n{"
+    f"{format_post_edits_example}" + "}\n"
+)
+
+SEPARATOR = "-" * 40
+
+
+def prompt_token_budget() -> int:
+    return settings.AI_PROMPT_TOKEN_BUDGETS.get(active_model(), settings.AI_PROMPT_TOKEN_BUDGET)
+
+
+def _post_section(post: str) -> str:
+    return f"{SEPARATOR}\n The post: \n" + "{" + f"{post}" + "} \n" + SEPARATOR + "\n"
+
+
+def _candidates_section(candidates: list[CatalogEntry]) -> str:
+    if not candidates:
+        return ""
+    limit = settings.SUBREDDIT_CATALOG_DESCRIPTION_MAX_CHARS
+    lines = [
+        f"r/{entry.name} ({entry.subscribers} subscribers) - {entry.description[:limit]}".replace("\n", " ")
+        for entry in candidates
+    ]
+    return "\n Choose subreddits only from this list: \n" + "\n".join(lines) + "\n"
+
+
+def create_subreddit_suggestion_prompt(post: str, candidates: list[CatalogEntry] | None = None):
+    # Если загружен каталог, модель выбирает из найденных по нему кандидатов, а не придумывает названия
+    if candidates is None:
+        candidates = subreddit_candidates(post)
+    head = SUBREDDIT_SUGGESTION_INSTRUCTIONS + _candidates_section(candidates)
+    # Для подбора сабреддитов хватает начала поста, поэтому длинный пост обрезаем под бюджет
+    budget = prompt_token_budget() - count_tokens(head + _post_section(""))
+    prompt = head + _post_section(truncate_to_tokens(post, budget))
+    return prompt
+
+
+def _format_prompt(instructions: str, post: str, subreddit_name: str, subreddit_rules: str) -> str:
+    # Пост нужен модели целиком, поэтому под бюджет ужимаются только правила.
+    # Но без правил форматировать бессмысленно: если пост не оставляет им AI_PROMPT_MIN_RULES_SHARE
+    # бюджета (или меньше, если им столько не нужно), промпт не собирается.
+    head = instructions + f"\n Subreddit name: '{subreddit_name}' \n"
+    available = prompt_token_budget() - count_tokens(head + _post_section("") + "\n Subreddit rules: \n{} \n")
+    rules_needed = count_tokens(compact_rules(subreddit_rules, settings.AI_RULE_DESCRIPTION_MAX_CHARS))
+    reserve = min(rules_needed, int(available * settings.AI_PROMPT_MIN_RULES_SHARE))
+    budget = available - count_tokens(post)
+    if budget < reserve:
+        raise PostTooLong()
+    tail = _post_section(post)
+    rules = fit_rules(subreddit_rules, budget, settings.AI_RULE_DESCRIPTION_MAX_CHARS)
     prompt = (
-        f"You are a Reddit expert. Analyze the following Reddit post and suggest 3-5 relevant subreddits where it could be posted.\n"
-        f"Focus on the topic, tone, and content.\n" + 
-        ("-"*40)+
-        f"\n The post: \n"
-        "{" + f"{post}" + "} \n" +
-        ("-"*40) +
-        "\n Return reponse in such format, do not add anything else:\n{"
-        f"{suggest_subreddit_example}" + "}\n"
+        head +
+        "\n Subreddit rules: \n"
+        "{" + f"{rules}" + "} \n" +
+        tail
     )
     return prompt
 
 
 def create_format_post_for_subreddit_prompt(post: str, subreddit_name: str, subreddit_rules: str):
-    prompt = (
-        f"You are a Reddit expert. Analyze the following Reddit post and format it according subreddit rules.\n"
-        f"Focus on the topic, tone, and content.\n" + 
-        ("-"*40)+
-        f"\n The post: \n"
-        "{" + f"{post}" + "} \n" +
-        ("-"*40) +
-        f"\n Subreddit name: '{subreddit_name}' \n"
-        f"\n Subreddit rules: \n"
-        "{" + f"{subreddit_rules}" + "} \n" +
-        "\n Return reponse in such format, do not add anything else:\n{"
-        f"{format_post_for_subreddit_example}" + "}\n"
-    )
-    return prompt
\ No newline at end of file
+    return _format_prompt(FORMAT_POST_INSTRUCTIONS, post, subreddit_name, subreddit_rules)
+
+
+def create_format_post_edits_prompt(post: str, subreddit_name: str, subreddit_rules: str):
+    return _format_prompt(FORMAT_POST_EDITS_INSTRUCTIONS, post, subreddit_name, subreddit_rules)
@@ -0,0 +1,346 @@
+from core.config import settings
+from services.ai.http_client import get_ai_http_client
+from services.ai.ollama.ollama_service import OllamaService
+from services.metrics.metrics import (
+    AI_PROVIDER_TTFT_SECONDS,
+    AI_PROVIDER_ERRORS,
+    AI_HEDGED_REQUESTS,
+    UPSTREAM_RETRIES,
+)
+from services.resilience.circuit_breaker import CircuitBreaker, get_circuit_breaker, backoff_delay
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, Callable, Optional
+import asyncio
+import httpx
+import json
+import logging
+import random
+import time
+
+
+OPENROUTER_PROVIDER = "openrouter"
+OLLAMA_PROVIDER = "ollama"
+STUB_PROVIDER = "stub"
+
+
+ollama_service = OllamaService(
+    address=settings.OLLAMA_URL,
+    model=settings.OLLAMA_MODEL,
+    keep_alive=settings.OLLAMA_KEEP_ALIVE,
+    options={
+        "temperature": settings.OLLAMA_TEMPERATURE,
+        "num_ctx": settings.OLLAMA_NUM_CTX,
+        "num_predict": settings.OLLAMA_NUM_PREDICT,
+    },
+)
+
+
+def create_data_for_model(prompt: str):
+    return {
+        "model": settings.AI_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "stream": True
+    }
+
+
+async def stream_openrouter_response(prompt: str) -> AsyncGenerator[str, None]:
+    """
+    Asynchronously stream response from OpenRouter API for a given prompt.
+    Yields chunks of the response as they arrive.
+    """
+    headers = {
+        "Authorization": f"Bearer {settings.AI_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    
+    data = create_data_for_model(prompt)
+
+    client = get_ai_http_client()
+    try:
+        async with client.stream("POST", settings.AI_API_URL, json=data, headers=headers) as response:
+            if response.status_code != 200:
+                yield f"Error: Failed to fetch data from API. Status Code: {response.status_code}"
+                return
+            
+            async for line in response.aiter_lines():
+                if line.startswith("data: "):
+                    chunk = line[6:].strip()
+                    if chunk == "[DONE]":
+                        yield chunk
+                        break
+                    try:
+                        json_chunk = json.loads(chunk)
+                        content = json_chunk.get("choices", [{}])[0].get("delta", {}).get("content", "")
+                        if content:
+                            yield content
+                    except json.JSONDecodeError:
+                        continue
+    except httpx.RequestError as e:
+        yield f"Error: Request failed - {str(e)}"
+
+
+async def stream_ollama_response(prompt: str) -> AsyncGenerator[str, None]:
+    """
+    Streams a response from the local Ollama model with the same chunks
+    as stream_openrouter_response: tokens, then "[DONE]" or an "Error: ..." chunk.
+    """
+    try:
+        async for token in ollama_service.get_chat_stream(prompt):
+            yield token
+        yield "[DONE]"
+    except Exception as e:
+        logging.error(e)
+        yield f"Error: Request failed - {str(e)}"
+
+
+async def stream_stub_response(prompt: str) -> AsyncGenerator[str, None]:
+    """Local stand-in for development and load tests, answers AI_STUB_RESPONSE without a model."""
+    for token in settings.AI_STUB_RESPONSE.split(" "):
+        yield token + " "
+    yield "[DONE]"
+
+
+@dataclass
+class ProviderStats:
+    """Rolling time-to-first-token and error rate over the last AI_ROUTER_WINDOW generations."""
+    ttfts: deque = field(default_factory=lambda: deque(maxlen=settings.AI_ROUTER_WINDOW))
+    outcomes: deque = field(default_factory=lambda: deque(maxlen=settings.AI_ROUTER_WINDOW))
+
+    def record_first_token(self, ttft: float) -> None:
+        self.ttfts.append(ttft)
+        self.outcomes.append(False)
+
+    def record_error(self) -> None:
+        self.outcomes.append(True)
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    @property
+    def mean_ttft(self) -> Optional[float]:
+        return sum(self.ttfts) / len(self.ttfts) if self.ttfts else None
+
+    def score(self) -> float:
+        """
+        Lower is better. Until a provider has produced a first token its TTFT is taken
+        as AI_ROUTER_TTFT_PRIOR, so one that fails before streaming is still penalized.
+        """
+        ttft = self.mean_ttft if self.mean_ttft is not None else settings.AI_ROUTER_TTFT_PRIOR
+        return ttft * (1 + settings.AI_ROUTER_ERROR_PENALTY * self.error_rate)
+
+
+@dataclass
+class LLMProvider:
+    name: str
+    model: str
+    stream: Callable[[str], AsyncGenerator[str, None]]
+    stats: ProviderStats = field(default_factory=ProviderStats)
+    breaker: CircuitBreaker = None
+
+    def __post_init__(self):
+        if self.breaker is None:
+            self.breaker = get_circuit_breaker(f"ai:{self.name}")
+
+
+_END = object()
+
+# Модель провайдера, который выиграл последнюю генерацию в этой задаче
+_answered_model: ContextVar[Optional[str]] = ContextVar("answered_model", default=None)
+
+
+class _ProviderRun:
+    """
+    Drives one provider stream in its own task and records its stats.
+    Failures before the first token are retried with jittered backoff while the
+    circuit allows it; once a token has been produced the stream is never restarted.
+    """
+
+    def __init__(self, provider: LLMProvider, prompt: str):
+        self.provider = provider
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._pump(prompt))
+
+    async def _attempt(self, prompt: str) -> Optional[str]:
+        """Streams one attempt into the queue. Returns the error if it failed before the first token."""
+        stream = self.provider.stream(prompt)
+        started = time.monotonic()
+        first = True
+        try:
+            async for chunk in stream:
+                if chunk.startswith("Error:"):
+                    if first:
+                        return chunk
+                    self._record_error()
+                    await self.provider.breaker.record_failure()
+                elif first:
+                    ttft = time.monotonic() - started
+                    self.provider.stats.record_first_token(ttft)
+                    AI_PROVIDER_TTFT_SECONDS.labels(provider=self.provider.name).observe(ttft)
+                    await self.provider.breaker.record_success()
+                first = False
+                self.queue.put_nowait(chunk)
+        except Exception as e:
+            logging.error(e)
+            if first:
+                return f"Error: Request failed - {str(e)}"
+            self._record_error()
+            await self.provider.breaker.record_failure()
+            self.queue.put_nowait(f"Error: Request failed - {str(e)}")
+        finally:
+            await stream.aclose()
+        return None
+
+    async def _pump(self, prompt: str) -> None:
+        try:
+            attempt = 1
+            while True:
+                error = await self._attempt(prompt)
+                if error is None:
+                    return
+                self._record_error()
+                await self.provider.breaker.record_failure()
+                if attempt >= settings.UPSTREAM_RETRY_ATTEMPTS or not await self.provider.breaker.allow():
+                    self.queue.put_nowait(error)
+                    return
+                UPSTREAM_RETRIES.labels(upstream=self.provider.breaker.name).inc()
+                await asyncio.sleep(backoff_delay(attempt))
+                attempt += 1
+        finally:
+            self.queue.put_nowait(_END)
+
+    def _record_error(self) -> None:
+        self.provider.stats.record_error()
+        AI_PROVIDER_ERRORS.labels(provider=self.provider.name).inc()
+
+    def cancel(self) -> None:
+        self._task.cancel()
+
+
+class LLMRouter:
+    """
+    Picks the provider with the best rolling TTFT/error score, with a small
+    exploration rate so a recovered provider gets noticed. With AI_HEDGE_AFTER > 0,
+    a second provider is started when the first hasn't produced a token in time,
+    and whichever streams first is kept.
+    """
+
+    def __init__(self, providers: list[LLMProvider]):
+        self.providers = providers
+
+    def ranked(self) -> list[LLMProvider]:
+        # Заглушка отвечает мгновенно и выиграла бы по задержке, поэтому она всегда последняя
+        ranked = sorted(
+            (provider for provider in self.providers if provider.name != STUB_PROVIDER),
+            key=lambda provider: provider.stats.score(),
+        )
+        if len(ranked) > 1 and random.random() < settings.AI_ROUTER_EXPLORE_RATE:
+            ranked.insert(0, ranked.pop(random.randrange(1, len(ranked))))
+        return ranked + [provider for provider in self.providers if provider.name == STUB_PROVIDER]
+
+    async def stream(self, prompt: str) -> AsyncGenerator[str, None]:
+        _answered_model.set(None)
+        candidates = self.ranked()
+        runs: list[_ProviderRun] = []
+        first_chunks: dict[asyncio.Task, _ProviderRun] = {}
+        winner = None
+        chunk = None
+
+        async def start_next() -> bool:
+            while candidates:
+                provider = candidates.pop(0)
+                # Провайдеры с открытым контуром пропускаем сразу
+                if await provider.breaker.allow():
+                    run = _ProviderRun(provider, prompt)
+                    runs.append(run)
+                    first_chunks[asyncio.create_task(run.queue.get())] = run
+                    return True
+            return False
+
+        loop = asyncio.get_running_loop()
+        if not await start_next():
+            yield "Error: AI provider is temporarily unavailable"
+            return
+        hedge_at = loop.time() + settings.AI_HEDGE_AFTER
+        hedging = settings.AI_HEDGE_AFTER > 0
+        try:
+            while winner is None:
+                timeout = max(hedge_at - loop.time(), 0) if hedging and candidates and len(runs) == 1 else None
+                done, _ = await asyncio.wait(first_chunks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    await start_next()
+                    continue
+                for task in done:
+                    run = first_chunks.pop(task)
+                    chunk = task.result()
+                    if chunk is not _END and not chunk.startswith("Error:"):
+                        winner = run
+                        break
+                    run.cancel()
+                    # Провайдер ответил ошибкой — пробуем следующий, если он есть
+                    if not first_chunks and not await start_next():
+                        if chunk is not _END:
+                            yield chunk
+                        return
+        finally:
+            for task in first_chunks:
+                task.cancel()
+            for run in runs:
+                if run is not winner:
+                    run.cancel()
+
+        if len(runs) > 1:
+            AI_HEDGED_REQUESTS.labels(winner=winner.provider.name).inc()
+        _answered_model.set(winner.provider.model)
+
+        try:
+            while chunk is not _END:
+                yield chunk
+                chunk = await winner.queue.get()
+        finally:
+            winner.cancel()
+
+
+_PROVIDERS = {
+    OPENROUTER_PROVIDER: lambda: LLMProvider(OPENROUTER_PROVIDER, settings.AI_MODEL, stream_openrouter_response),
+    OLLAMA_PROVIDER: lambda: LLMProvider(OLLAMA_PROVIDER, settings.OLLAMA_MODEL, stream_ollama_response),
+    STUB_PROVIDER: lambda: LLMProvider(STUB_PROVIDER, STUB_PROVIDER, stream_stub_response),
+}
+
+
+def _enabled_provider_names() -> list[str]:
+    names = [name.strip() for name in settings.AI_PROVIDERS.split(",") if name.strip()]
+    return names or [settings.AI_BACKEND]
+
+
+router = LLMRouter([_PROVIDERS[name]() for name in _enabled_provider_names()])
+
+
+def active_model() -> str:
+    """Model of the primary configured provider; cached responses are looked up under it."""
+    return router.providers[0].model
+
+
+def answered_model() -> Optional[str]:
+    """
+    Model of the provider whose stream the router returned in the current task,
+    None before a winner is picked. Fallback and hedged answers are cached under it,
+    so they are never replayed as answers of the primary model.
+    """
+    return _answered_model.get()
+
+
+def stream_llm_response(prompt: str) -> AsyncGenerator[str, None]:
+    """Streams from the provider chosen by the router."""
+    return router.stream(prompt)
+
+
+async def start_ai_backend() -> None:
+    if any(provider.name == OLLAMA_PROVIDER for provider in router.providers):
+        await ollama_service.preload()
+
+
+async def close_ai_backend() -> None:
+    await ollama_service.close()
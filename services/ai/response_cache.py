@@ -0,0 +1,115 @@
+from core.config import settings
+from database.redis import redis
+from services.ai.admission import is_queue_event
+from services.ai.providers import answered_model
+from services.metrics.metrics import AI_RESPONSE_CACHE_HITS, AI_RESPONSE_CACHE_MISSES
+from typing import AsyncGenerator, Callable, Optional
+import hashlib
+import json
+import logging
+import re
+import time
+
+
+RESPONSE_KEY_PREFIX = "ai_response:"
+RESPONSE_INDEX_KEY = "ai_response_index"
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    return _WHITESPACE.sub(" ", prompt).strip()
+
+
+def response_cache_key(prompt: str, model: str) -> str:
+    """
+    The key covers the model, AI_RESPONSE_CACHE_VERSION and the normalized prompt.
+    Subreddit rules are part of the format prompt, so changed rules give a new key.
+    """
+    digest = hashlib.sha256(
+        "\0".join((model, settings.AI_RESPONSE_CACHE_VERSION, normalize_prompt(prompt))).encode()
+    ).hexdigest()
+    return f"{RESPONSE_KEY_PREFIX}{digest}"
+
+
+async def get_cached_response(key: str) -> Optional[list[str]]:
+    try:
+        raw = await redis.get(key)
+    except Exception as e:
+        logging.error(e)
+        return None
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
+
+
+async def has_cached_response(key: str) -> bool:
+    try:
+        return bool(await redis.exists(key))
+    except Exception as e:
+        logging.error(e)
+        return False
+
+
+async def save_response(key: str, chunks: list[str]) -> None:
+    payload = json.dumps(chunks)
+    if len(payload) > settings.AI_RESPONSE_CACHE_MAX_ENTRY_BYTES:
+        return
+    now = time.time()
+    try:
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.setex(key, settings.AI_RESPONSE_CACHE_TTL, payload)
+            pipe.zadd(RESPONSE_INDEX_KEY, {key: now})
+            pipe.zremrangebyscore(RESPONSE_INDEX_KEY, "-inf", now - settings.AI_RESPONSE_CACHE_TTL)
+            pipe.zcard(RESPONSE_INDEX_KEY)
+            *_, size = await pipe.execute()
+
+        overflow = size - settings.AI_RESPONSE_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            # Вытесняем самые старые записи
+            evicted = await redis.zpopmin(RESPONSE_INDEX_KEY, overflow)
+            if evicted:
+                await redis.delete(*(member for member, _ in evicted))
+    except Exception as e:
+        logging.error(e)
+
+
+async def stream_with_response_cache(
+    prompt: str,
+    model: str,
+    upstream: Callable[[str], AsyncGenerator[str, None]],
+    use_cache: bool = True,
+) -> AsyncGenerator[str, None]:
+    """
+    Replays a cached response chunk by chunk followed by "[DONE]", exactly as the
+    upstream stream would produce it. On a miss streams from upstream and stores
+    the response once it completes without errors, under the model that actually answered.
+    With use_cache=False the cached entry is skipped but refreshed with the new response.
+    """
+    key = response_cache_key(prompt, model)
+
+    if use_cache:
+        chunks = await get_cached_response(key)
+        if chunks is not None:
+            AI_RESPONSE_CACHE_HITS.inc()
+            for chunk in chunks:
+                yield chunk
+            yield "[DONE]"
+            return
+
+    AI_RESPONSE_CACHE_MISSES.inc()
+    chunks = []
+    async for chunk in upstream(prompt):
+        if chunk.startswith("Error:"):
+            yield chunk
+            return
+        if chunk == "[DONE]":
+            await save_response(response_cache_key(prompt, answered_model() or model), chunks)
+            yield chunk
+            return
+        if not is_queue_event(chunk):
+            chunks.append(chunk)
+        yield chunk
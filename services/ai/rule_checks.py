@@ -0,0 +1,196 @@
+from dataclasses import dataclass, field
+from functools import lru_cache
+from services.ai.post_edits import FormattedPost
+from typing import Callable, Optional
+import json
+import re
+
+
+_URL = re.compile(r"(?:https?://|www\.)\S+", re.IGNORECASE)
+# [Question] в тексте правила, но не ссылка вида [текст](url)
+_TAG = re.compile(r"\[([^\[\]\n]{1,25})\](?!\()")
+_MARKDOWN_LINK = re.compile(r"\[([^\[\]]*)\]\([^)]*\)")
+
+_MIN = r"(?:at least|a minimum of|minimum of|min\.?|more than|longer than)"
+_MAX = r"(?:at most|a maximum of|maximum of|max\.?|no more than|no longer than|less than|fewer than|under|shorter than|up to)"
+_LENGTH = r"(\d+)\s*(char|word)"
+_TITLE_MIN = re.compile(rf"title[^.]{{0,40}}?{_MIN}\s+{_LENGTH}")
+_TITLE_MAX = re.compile(rf"title[^.]{{0,40}}?{_MAX}\s+{_LENGTH}")
+_BODY_MIN = re.compile(rf"(?:post|body|text|submission)s?[^.]{{0,40}}?{_MIN}\s+{_LENGTH}")
+_NO_LINKS = re.compile(
+    r"\bno (?:external |outside )?(?:links|urls?)\b"
+    r"|\b(?:links|urls) (?:are|is) not allowed\b"
+    r"|\bdo not (?:post|include|add) (?:any )?(?:links|urls)\b"
+)
+_QUESTION_TITLE = re.compile(r"title[^.]{0,40}?(?:be a question|end (?:with|in) a question mark)")
+_TAG_REQUIRED = re.compile(r"title[^.]*(?:tag|must|required|start|begin|prefix)|(?:tag|must|required|start|begin|prefix)[^.]*title")
+_BANNED_WORDS = re.compile(r"(?:do not|don't|never) use (?:the )?(?:words?|terms?|phrases?)\s+((?:\"[^\"]+\"[,\s]*(?:or|and)?\s*)+)")
+_QUOTED = re.compile(r"\"([^\"]+)\"")
+# Запрет в предложении с тегом: "Titles must not start with [NSFW]"
+_NEGATION = re.compile(r"\b(?:not|no|never|don't|do not|cannot|can't|mustn't|without)\b")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+# Части правил, которые проверяются только по смыслу, даже если рядом есть механическая часть
+_SEMANTIC = re.compile(r"spam|promot|advertis|low[- ]effort|relevant|related to|on[- ]topic|off[- ]topic|survey|repost|duplicate")
+
+# Правила поведения по тексту поста не проверить механически — их проверяет модель
+_CONDUCT = re.compile(r"\b(?:civil|respect|harass|reddiquette|be nice|be kind|hate speech|bigotry|personal attacks?)")
+
+
+@dataclass
+class RuleCheck:
+    rule_number: Optional[int]
+    short_name: str
+    passes: Callable[[str, str], bool]
+    # Детерминированное исправление (title, body) -> (title, body), если оно есть
+    fix: Optional[Callable[[str, str], tuple[str, str]]] = None
+
+
+@dataclass
+class CompiledRules:
+    checks: list[RuleCheck] = field(default_factory=list)
+    # Правила, которые можно проверить только моделью
+    unchecked: list[str] = field(default_factory=list)
+
+
+@dataclass
+class ComplianceReport:
+    title: str
+    body: str
+    score: float
+    violations: list[str]
+    # К посту применены детерминированные исправления
+    fixed: bool
+    # Пост после детерминированных исправлений и все правила соблюдены — модель не нужна
+    compliant: bool
+
+    def formatted(self) -> FormattedPost:
+        return FormattedPost(self.title, self.body, self.score)
+
+
+def _length(text: str, unit: str) -> int:
+    return len(text.split()) if unit == "word" else len(text.strip())
+
+
+def _remove_links(title: str, body: str) -> tuple[str, str]:
+    return _URL.sub("", title).strip(), _URL.sub("", body).strip()
+
+
+def _prefix_tag(tag: str) -> Callable[[str, str], tuple[str, str]]:
+    return lambda title, body: (f"[{tag}] {title}", body)
+
+
+def _tag_negated(text: str, tags: list[str]) -> bool:
+    """True when a sentence mentioning one of the tags forbids rather than requires it."""
+    lowered = [f"[{tag.lower()}]" for tag in tags]
+    return any(
+        _NEGATION.search(sentence)
+        for sentence in _SENTENCE.split(text)
+        if any(tag in sentence for tag in lowered)
+    )
+
+
+def _compile_rule(rule_number: Optional[int], short_name: str, description: str) -> tuple[list[RuleCheck], bool]:
+    """Returns the local checks for one rule and whether the model is still needed to check it fully."""
+    tags = _TAG.findall(f"{short_name} {description}")
+    text = _MARKDOWN_LINK.sub(r"\1", f"{short_name}. {description}").lower()
+    checks = []
+    negated_tags = False
+
+    def add(passes: Callable[[str, str], bool], fix=None) -> None:
+        checks.append(RuleCheck(rule_number, short_name, passes, fix))
+
+    if match := _TITLE_MIN.search(text):
+        limit, unit = int(match[1]), match[2]
+        add(lambda title, body: _length(title, unit) >= limit)
+    if match := _TITLE_MAX.search(text):
+        limit, unit = int(match[1]), match[2]
+        add(lambda title, body: _length(title, unit) <= limit)
+    if match := _BODY_MIN.search(text):
+        if "title" not in match[0]:
+            limit, unit = int(match[1]), match[2]
+            add(lambda title, body: _length(body, unit) >= limit)
+    if _NO_LINKS.search(text):
+        add(lambda title, body: not _URL.search(title) and not _URL.search(body), _remove_links)
+    if _QUESTION_TITLE.search(text):
+        add(lambda title, body: title.rstrip().endswith("?"))
+    if tags and _TAG_REQUIRED.search(text):
+        lowered = [f"[{tag.lower()}]" for tag in tags]
+        if _tag_negated(text, tags):
+            # Запрет тега не исправляем, а прочтение отрицания перепроверяет модель
+            negated_tags = True
+            add(lambda title, body: not any(tag in title.lower() for tag in lowered))
+        else:
+            add(
+                lambda title, body: any(tag in title.lower() for tag in lowered),
+                _prefix_tag(tags[0]) if len(tags) == 1 else None,
+            )
+    if match := _BANNED_WORDS.search(text):
+        words = [re.compile(rf"\b{re.escape(word)}\b", re.IGNORECASE) for word in _QUOTED.findall(match[1])]
+        add(lambda title, body: not any(word.search(title) or word.search(body) for word in words))
+
+    return checks, not checks or negated_tags or bool(_SEMANTIC.search(text) or _CONDUCT.search(text))
+
+
+@lru_cache(maxsize=1024)
+def compile_rules(subreddit_rules: str) -> CompiledRules:
+    """
+    Turns the rules JSON from get_subreddit_rules into local checks where the rule is mechanical
+    (title and body length, required title tags, links, question titles, banned words).
+    Compiled once per rules string.
+    """
+    compiled = CompiledRules()
+    try:
+        rules = json.loads(subreddit_rules).get("rules") or []
+    except (ValueError, AttributeError):
+        rules = []
+    if not isinstance(rules, list) or not rules:
+        compiled.unchecked.append("rules")
+        return compiled
+
+    for rule in rules:
+        if not isinstance(rule, dict):
+            compiled.unchecked.append(str(rule))
+            continue
+        short_name = str(rule.get("short_name") or "")
+        checks, needs_model = _compile_rule(rule.get("rule_number"), short_name, str(rule.get("description") or ""))
+        compiled.checks.extend(checks)
+        if needs_model:
+            compiled.unchecked.append(short_name)
+    return compiled
+
+
+def split_post(post: str) -> tuple[str, str]:
+    """The first non-empty line of the post is its title, the rest is the body."""
+    title, _, body = post.strip().partition("\n")
+    return title.strip(), body.strip()
+
+
+def check_post(post: str, subreddit_rules: str) -> ComplianceReport:
+    """
+    Checks the post against the mechanical rules and applies deterministic fixes.
+    The score is the share of checks the returned post passes after the fixes;
+    the post is compliant only with a score of 1.0 and no rules left for the model.
+    """
+    compiled = compile_rules(subreddit_rules)
+    title, body = split_post(post)
+
+    violations = [check for check in compiled.checks if not check.passes(title, body)]
+    fixed = False
+    for check in violations:
+        if check.fix is not None:
+            title, body = check.fix(title, body)
+            fixed = True
+
+    # Исправление одного правила может нарушить другое, поэтому проверяем итоговый пост целиком
+    passed = sum(check.passes(title, body) for check in compiled.checks)
+    score = round(passed / len(compiled.checks), 2) if compiled.checks else 1.0
+
+    return ComplianceReport(
+        title=title,
+        body=body,
+        score=score,
+        violations=[check.short_name for check in violations],
+        fixed=fixed,
+        compliant=passed == len(compiled.checks) and not compiled.unchecked,
+    )
@@ -0,0 +1,123 @@
+from array import array
+from collections import Counter
+from typing import Optional
+import hashlib
+import re
+
+
+FINGERPRINT_BITS = 64
+
+_WORD = re.compile(r"\w+")
+
+
+def _features(text: str) -> Counter:
+    words = _WORD.findall(text.lower())
+    features = Counter(words)
+    features.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return features
+
+
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big")
+
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash over words and word bigrams. Case, punctuation and whitespace
+    don't affect it, and posts differing in a few words land a few bits apart.
+    """
+    weighted = [(_feature_hash(feature), weight) for feature, weight in _features(text).items()]
+    fingerprint = 0
+    for bit in range(FINGERPRINT_BITS):
+        mask = 1 << bit
+        total = 0
+        for feature_hash, weight in weighted:
+            total += weight if feature_hash & mask else -weight
+        if total > 0:
+            fingerprint |= mask
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class SimHashIndex:
+    """
+    Bounded in-memory LSH index of SimHash fingerprints.
+
+    The fingerprint is split into max_distance + 1 bands, so by the pigeonhole principle
+    any fingerprint within max_distance bits shares at least one band exactly and is found
+    by scanning that band's bucket. Fingerprints are stored in typed arrays (8 bytes per
+    band per entry); once max_entries is reached the oldest entry is evicted.
+    """
+
+    def __init__(self, max_entries: int, max_distance: int):
+        if not 0 <= max_distance < FINGERPRINT_BITS:
+            raise ValueError("max_distance must be between 0 and 63")
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._bands = self._band_layout(max_distance + 1)
+        self._buckets: list[dict[int, array]] = [{} for _ in self._bands]
+        self._order = array("Q", bytes(8 * max_entries))
+        self._next = 0
+        self._size = 0
+
+    @staticmethod
+    def _band_layout(bands: int) -> list[tuple[int, int]]:
+        layout = []
+        shift = 0
+        for band in range(bands):
+            width = FINGERPRINT_BITS // bands + (1 if band < FINGERPRINT_BITS % bands else 0)
+            layout.append((shift, (1 << width) - 1))
+            shift += width
+        return layout
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, fingerprint: int) -> bool:
+        shift, mask = self._bands[0]
+        bucket = self._buckets[0].get((fingerprint >> shift) & mask)
+        return bucket is not None and fingerprint in bucket
+
+    def add(self, fingerprint: int) -> None:
+        if self.max_entries == 0 or fingerprint in self:
+            return
+        if self._size == self.max_entries:
+            self._remove(self._order[self._next])
+        else:
+            self._size += 1
+        self._order[self._next] = fingerprint
+        self._next = (self._next + 1) % self.max_entries
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            key = (fingerprint >> shift) & mask
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = array("Q", (fingerprint,))
+            else:
+                bucket.append(fingerprint)
+
+    def _remove(self, fingerprint: int) -> None:
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            key = (fingerprint >> shift) & mask
+            bucket = buckets[key]
+            bucket.remove(fingerprint)
+            if not bucket:
+                del buckets[key]
+
+    def find(self, fingerprint: int) -> Optional[int]:
+        """Returns the closest stored fingerprint within max_distance bits, if any."""
+        best = None
+        best_distance = self.max_distance + 1
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            bucket = buckets.get((fingerprint >> shift) & mask)
+            if bucket is None:
+                continue
+            for candidate in bucket:
+                distance = (candidate ^ fingerprint).bit_count()
+                if distance < best_distance:
+                    best, best_distance = candidate, distance
+                    if distance == 0:
+                        return best
+        return best
@@ -0,0 +1,119 @@
+from core.config import settings
+from database.redis import redis
+from services.ai.providers import active_model
+from services.ai.simhash import SimHashIndex, simhash
+from services.ai.response_cache import get_cached_response
+from services.metrics.metrics import SIMILAR_POST_HITS, SIMILAR_POST_MISSES
+from typing import Optional
+import asyncio
+import hashlib
+import logging
+
+
+# Каждый воркер держит свой индекс отпечатков и догоняет остальные воркеры
+# через общий Redis Stream, в который пишутся отпечатки новых постов.
+class _Namespace:
+    """Fingerprints of posts answered by one model, cache version and suggestion scope."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.index = SimHashIndex(settings.SIMILAR_POSTS_MAX_ENTRIES, settings.SIMILAR_POSTS_MAX_DISTANCE)
+        self.last_stream_id = "0-0"
+        self.sync_lock = asyncio.Lock()
+
+    @property
+    def stream_key(self) -> str:
+        return f"similar_posts:{self.name}"
+
+    def response_key(self, fingerprint: int) -> str:
+        return f"similar_post:{self.name}:{fingerprint:016x}"
+
+
+# Индексы создаются при первом обращении, чтобы при SIMILAR_POSTS_ENABLED=false память не выделялась
+_namespaces: dict[str, _Namespace] = {}
+
+
+def _namespace(scope: str) -> _Namespace:
+    # Ответы другой модели, версии кеша или другого режима подбора не должны переиспользоваться
+    name = hashlib.sha256(
+        f"{active_model()}\0{settings.AI_RESPONSE_CACHE_VERSION}\0{scope}".encode()
+    ).hexdigest()[:12]
+    namespace = _namespaces.get(name)
+    if namespace is None:
+        namespace = _namespaces[name] = _Namespace(name)
+    return namespace
+
+
+async def _sync_index(namespace: _Namespace, max_batches: int | None = 1) -> None:
+    """Adds fingerprints written by other workers since the last sync."""
+    async with namespace.sync_lock:
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            response = await redis.xread(
+                {namespace.stream_key: namespace.last_stream_id},
+                count=settings.SIMILAR_POSTS_SYNC_BATCH,
+            )
+            if not response:
+                return
+            _, entries = response[0]
+            for entry_id, fields in entries:
+                namespace.index.add(int(fields["fp"], 16))
+                namespace.last_stream_id = entry_id
+            batches += 1
+            if len(entries) < settings.SIMILAR_POSTS_SYNC_BATCH:
+                return
+
+
+async def load_similar_posts_index(scopes: list[str]) -> None:
+    """Catches up with the fingerprints of the given scopes, so the first requests don't have to."""
+    if not settings.SIMILAR_POSTS_ENABLED:
+        return
+    for scope in scopes:
+        try:
+            await _sync_index(_namespace(scope), max_batches=None)
+        except Exception as e:
+            logging.error(e)
+
+
+async def find_similar_response(post: str, scope: str) -> Optional[list[str]]:
+    """
+    Returns the cached model response of a previously analyzed post in the same scope
+    that is within SIMILAR_POSTS_MAX_DISTANCE bits of this one, if it is still cached.
+    """
+    if not settings.SIMILAR_POSTS_ENABLED:
+        return None
+    fingerprint = simhash(post)
+    namespace = _namespace(scope)
+    try:
+        await _sync_index(namespace)
+        match = namespace.index.find(fingerprint)
+        if match is not None:
+            response_key = await redis.get(namespace.response_key(match))
+            if response_key:
+                chunks = await get_cached_response(response_key)
+                if chunks is not None:
+                    SIMILAR_POST_HITS.inc()
+                    return chunks
+    except Exception as e:
+        logging.error(e)
+    SIMILAR_POST_MISSES.inc()
+    return None
+
+
+async def remember_similar_response(post: str, scope: str, response_key: str) -> None:
+    """Indexes the post so near-duplicates in the same scope can reuse the response stored under response_key."""
+    if not settings.SIMILAR_POSTS_ENABLED:
+        return
+    fingerprint = simhash(post)
+    namespace = _namespace(scope)
+    try:
+        await redis.setex(namespace.response_key(fingerprint), settings.AI_RESPONSE_CACHE_TTL, response_key)
+        if fingerprint not in namespace.index:
+            await redis.xadd(
+                namespace.stream_key,
+                {"fp": f"{fingerprint:016x}"},
+                maxlen=settings.SIMILAR_POSTS_MAX_ENTRIES,
+                approximate=True,
+            )
+    except Exception as e:
+        logging.error(e)
@@ -0,0 +1,100 @@
+from dataclasses import dataclass, asdict
+from typing import Optional
+import re
+
+
+# {1 - r/smallbusiness - "A community for small business owners." - 0.95}
+_ENTRY = re.compile(
+    r'^\s*(?P<rank>\d+)\s*-\s*r/(?P<name>[\w-]+)\s*-\s*"(?P<description>.*)"\s*(?:-\s*(?P<score>\d+(?:\.\d+)?)\s*)?$',
+    re.DOTALL,
+)
+_NAME = re.compile(r'r/([\w-]+)')
+_QUOTE_OR_CLOSE = re.compile(r'["}\n]')
+
+
+@dataclass
+class Suggestion:
+    rank: Optional[int]
+    name: str
+    description: Optional[str]
+    score: Optional[float]
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def parse_suggestion(entry: str) -> Optional[Suggestion]:
+    """Parses the text between { and } of one entry of suggest_subreddit_example.txt."""
+    match = _ENTRY.match(entry)
+    if match:
+        return Suggestion(
+            rank=int(match["rank"]),
+            name=match["name"],
+            description=match["description"],
+            score=float(match["score"]) if match["score"] else None,
+        )
+    # Модель отступила от формата — берём хотя бы название сабреддита
+    name = _NAME.search(entry)
+    if name:
+        return Suggestion(rank=None, name=name.group(1), description=None, score=None)
+    return None
+
+
+class SuggestionParser:
+    """
+    Streaming parser for the suggestion output. Each chunk is scanned once and only
+    the current unfinished {...} entry is buffered, so parsing stays linear in the
+    output size. An entry is emitted as soon as its closing brace arrives;
+    braces inside the quoted description don't end it, a line break always does.
+    """
+
+    def __init__(self):
+        self._entry: list[str] | None = None
+        self._in_quotes = False
+        self._names: set[str] = set()
+        self.suggestions: list[Suggestion] = []
+
+    def _complete(self, entry: str) -> list[Suggestion]:
+        suggestion = parse_suggestion(entry)
+        if suggestion is None or suggestion.name in self._names:
+            return []
+        self._names.add(suggestion.name)
+        self.suggestions.append(suggestion)
+        return [suggestion]
+
+    def feed(self, chunk: str) -> list[Suggestion]:
+        found = []
+        position = 0
+        while position < len(chunk):
+            if self._entry is None:
+                start = chunk.find("{", position)
+                if start == -1:
+                    break
+                self._entry = []
+                position = start + 1
+            else:
+                end = -1
+                for match in _QUOTE_OR_CLOSE.finditer(chunk, position):
+                    if match.group() == '"':
+                        self._in_quotes = not self._in_quotes
+                    elif match.group() == "\n" or not self._in_quotes:
+                        # Запись однострочная: перевод строки завершает её даже без закрывающей скобки
+                        end = match.start()
+                        break
+                if end == -1:
+                    self._entry.append(chunk[position:])
+                    break
+                self._entry.append(chunk[position:end])
+                entry, self._entry = "".join(self._entry), None
+                self._in_quotes = False
+                found.extend(self._complete(entry))
+                position = end + 1
+        return found
+
+    def finish(self) -> list[Suggestion]:
+        """Parses an entry the model left without a closing brace."""
+        if self._entry is None:
+            return []
+        entry, self._entry = "".join(self._entry), None
+        self._in_quotes = False
+        return self._complete(entry)
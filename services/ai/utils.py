@@ -1,88 +1,494 @@
-from openai import AsyncOpenAI
 from core.config import settings
 import json
-from typing import AsyncGenerator
-import httpx
-import re
+from typing import AsyncGenerator, Callable, Optional
+import asyncio
+import logging
 from services.reddit.utils import get_subreddit_rules
+from services.ai.providers import active_model, stream_llm_response, stream_openrouter_response
+from services.ai.response_cache import stream_with_response_cache, response_cache_key, has_cached_response
+from services.ai.inflight import coalesce_stream, is_in_flight
+from services.ai.admission import stream_with_admission, is_queue_event, admission_queue_has_room
+from services.ai.similar_posts import find_similar_response, remember_similar_response
+from services.ai.suggestion_parser import SuggestionParser
+from services.ai.prompts import (
+    create_subreddit_suggestion_prompt,
+    create_format_post_for_subreddit_prompt,
+    create_format_post_edits_prompt,
+)
+from services.reddit.catalog import get_subreddit_catalog, subreddit_candidates
+from services.reddit.catalog_vectors import get_vector_matcher
+from services.ai.post_edits import apply_post_edits, PostEditError
+from services.ai.rule_checks import check_post
+from services.errors.ai_errors import PostTooLong
+from services.metrics.metrics import AI_FORMAT_EDITS, AI_RULE_PRECHECKS, AI_ADMISSION_REJECTED
+from services.sse.encoder import SSEEvent, model_chunk_event, DONE_AI, RULES, DONE, ERROR, QUEUE, SUGGESTION
+from fastapi import HTTPException, status
 
 
-deepseek_client = AsyncOpenAI(
-    api_key=settings.AI_API_KEY,
-    base_url=settings.AI_API_URL
-)
+def _inflight_key(prompt: str, model: str, use_cache: bool) -> str:
+    return f"{response_cache_key(prompt, model)}:{int(use_cache)}"
+
+
+async def stream_model_response(prompt: str, use_cache: bool = True) -> AsyncGenerator[str, None]:
+    """
+    Streams the model response for a prompt, replaying it from the response cache when possible.
+    Identical requests in flight at the same time share one upstream generation,
+    and generations wait for a cluster-wide slot before calling the provider.
+    Load is shed only when a new generation would join a full admission queue: endpoints
+    answer 503 upfront through ensure_llm_capacity, and a queue that fills up after that check
+    ends the stream with an error. Cache hits and coalesced requests are never rejected.
+    """
+    model = active_model()
+    key = _inflight_key(prompt, model, use_cache)
+    def upstream(prompt: str) -> AsyncGenerator[str, None]:
+        return stream_with_admission(lambda: stream_llm_response(prompt))
+
+    source_factory = lambda: stream_with_response_cache(prompt, model, upstream, use_cache)
+    async for chunk in coalesce_stream(key, source_factory):
+        yield chunk
 
 
-def create_data_for_model(prompt: str):
-    return {
-        "model": "deepseek/deepseek-chat:free",
-        "messages": [{"role": "user", "content": prompt}],
-        "stream": True
-    }
+async def _generation_needed(prompt: str, use_cache: bool) -> bool:
+    model = active_model()
+    if use_cache and await has_cached_response(response_cache_key(prompt, model)):
+        return False
+    return not await is_in_flight(_inflight_key(prompt, model, use_cache))
 
 
-async def stream_openrouter_response(prompt: str) -> AsyncGenerator[str, None]:
+async def ensure_llm_capacity(
+    prompts: list[Optional[str]],
+    use_cache: bool = True,
+    post: Optional[str] = None,
+    mode: Optional[str] = None,
+) -> None:
     """
-    Asynchronously stream response from OpenRouter API for a given prompt.
-    Yields chunks of the response as they arrive.
+    Fast load shedding before a streaming response is started: raises a 503 with Retry-After
+    when the admission queue is full and one of the prompts would start a new generation.
+    Prompts answered from the response cache, by a generation already in flight or, given
+    the post and suggestion mode, by a near-duplicate post's suggestion are let through.
     """
-    headers = {
-        "Authorization": f"Bearer {settings.AI_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    data = create_data_for_model(prompt)
+    if await admission_queue_has_room():
+        return
+    if use_cache and post is not None and mode is not None:
+        if await find_similar_response(post, similar_posts_scope(mode)) is not None:
+            return
+    for prompt in prompts:
+        if prompt is not None and await _generation_needed(prompt, use_cache):
+            AI_ADMISSION_REJECTED.labels(reason="queue_full").inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Service is busy, please try again later",
+                headers={"Retry-After": str(settings.AI_ADMISSION_RETRY_AFTER)},
+            )
 
-    async with httpx.AsyncClient() as client:
-        try:
-            async with client.stream("POST", settings.AI_API_URL, json=data, headers=headers, timeout=30) as response:
-                if response.status_code != 200:
-                    yield f"Error: Failed to fetch data from API. Status Code: {response.status_code}"
-                    return
-                
-                async for line in response.aiter_lines():
-                    if line.startswith("data: "):
-                        chunk = line[6:].strip()
-                        if chunk == "[DONE]":
-                            yield chunk
-                            break
-                        try:
-                            json_chunk = json.loads(chunk)
-                            content = json_chunk.get("choices", [{}])[0].get("delta", {}).get("content", "")
-                            if content:
-                                yield content
-                        except json.JSONDecodeError:
-                            continue
-        except httpx.RequestError as e:
-            yield f"Error: Request failed - {str(e)}"
-    
-
-async def stream_subreddits_suggestion_and_rules(prompt: str) -> AsyncGenerator[str, None]:
-    subreddit_pattern = r'- r\/([\w-]+) -'
-    text = ""
-    subreddit_names = []
-    async for chunk in stream_openrouter_response(prompt):
+
+# fast — только векторный поиск по каталогу, llm — модель, hybrid — модель выбирает из кандидатов векторного поиска и BM25
+FAST = "fast"
+LLM = "llm"
+HYBRID = "hybrid"
+
+
+def suggestion_mode(mode: str) -> str:
+    """Falls back to llm when no catalog vectors are loaded."""
+    if mode != LLM and get_vector_matcher() is None:
+        logging.warning(f"Suggestion mode '{mode}' needs catalog vectors, using '{LLM}'")
+        return LLM
+    return mode
+
+
+async def create_suggestion_prompt(post: str, mode: str) -> Optional[str]:
+    """The suggestion prompt for the mode, or None in fast mode where no model is called."""
+    if mode == FAST:
+        return None
+    candidates = None
+    if mode == HYBRID:
+        limit = settings.SUBREDDIT_CATALOG_CANDIDATES
+        vector_candidates = [entry for entry, _ in await get_vector_matcher().match(post, limit)]
+        # Чередуем кандидатов из обоих поисков, чтобы в список попали лучшие из каждого
+        merged = {}
+        for pair in zip(vector_candidates, subreddit_candidates(post, limit)):
+            for entry in pair:
+                merged.setdefault(entry.name, entry)
+        for entry in vector_candidates:
+            merged.setdefault(entry.name, entry)
+        candidates = list(merged.values())[:limit]
+    return create_subreddit_suggestion_prompt(post, candidates)
+
+
+def similar_posts_scope(mode: str) -> str:
+    """
+    Near-duplicate posts reuse suggestions only within one mode and catalog:
+    both llm and hybrid prompts list candidates from the loaded catalog.
+    """
+    catalog = get_subreddit_catalog()
+    return f"{mode}:{catalog.fingerprint if catalog is not None else ''}"
+
+
+async def stream_fast_suggestion_response(post: str) -> AsyncGenerator[str, None]:
+    """Suggestions ranked by cosine similarity to catalog subreddits, as text in the model's format."""
+    matches = await get_vector_matcher().match(post, settings.SUBREDDIT_FAST_SUGGESTIONS)
+    limit = settings.SUBREDDIT_CATALOG_DESCRIPTION_MAX_CHARS
+    for rank, (entry, score) in enumerate(matches, 1):
+        description = " ".join(entry.description[:limit].split())
+        yield "{" + f'{rank} - r/{entry.name} - "{description}" - {max(score, 0):.2f}' + "}\n"
+    yield "[DONE]"
+
+
+async def stream_suggestion_response(
+    post: str,
+    prompt: Optional[str],
+    use_cache: bool = True,
+    mode: str = LLM,
+) -> AsyncGenerator[str, None]:
+    """
+    Like stream_model_response, but first tries to replay the suggestion made for
+    a near-duplicate post, and indexes this post once its response is complete.
+    Without a prompt streams the fast suggestions instead.
+    """
+    if prompt is None:
+        async for chunk in stream_fast_suggestion_response(post):
+            yield chunk
+        return
+
+    scope = similar_posts_scope(mode)
+    if use_cache:
+        chunks = await find_similar_response(post, scope)
+        if chunks is not None:
+            for chunk in chunks:
+                yield chunk
+            yield "[DONE]"
+            return
+
+    async for chunk in stream_model_response(prompt, use_cache):
+        if chunk == "[DONE]":
+            # Ответ запасного провайдера сохранён под его моделью, и переиспользовать его не нужно
+            response_key = response_cache_key(prompt, active_model())
+            if await has_cached_response(response_key):
+                await remember_similar_response(post, scope, response_key)
+        yield chunk
+
+
+def format_post_prompt(post: str, subreddit: str, subreddit_rules: str) -> Optional[str]:
+    """
+    The first prompt stream_formatted_post sends to the model, or None when the rule pre-check makes it unnecessary.
+    Raises PostTooLong like the prompt builders.
+    """
+    if settings.AI_RULE_PRECHECK_ENABLED:
+        report = check_post(post, subreddit_rules)
+        if report.compliant:
+            return None
+        if report.fixed:
+            post = f"{report.title}\n\n{report.body}"
+    if not settings.AI_FORMAT_EDITS_ENABLED or len(post) < settings.AI_FORMAT_EDITS_MIN_CHARS:
+        return create_format_post_for_subreddit_prompt(post, subreddit, subreddit_rules)
+    return create_format_post_edits_prompt(post, subreddit, subreddit_rules)
+
+
+async def stream_formatted_post(
+    post: str,
+    subreddit: str,
+    subreddit_rules: str,
+    use_cache: bool = True,
+) -> AsyncGenerator[str, None]:
+    """
+    Streams the post formatted for the subreddit, with the same chunks as stream_model_response.
+    The post is first checked against the subreddit's mechanical rules: when those rules are all
+    it has and the post satisfies them, possibly after deterministic fixes, no model is called.
+    Otherwise the model gets the fixed post.
+    Posts of at least AI_FORMAT_EDITS_MIN_CHARS are formatted from edits: the model returns
+    only the title and replace/delete operations, so output tokens don't grow with the post,
+    and the post is rebuilt here. If the edits don't apply cleanly the post is rewritten in full.
+    A post too long to leave room for the rules is never cut: the stream ends with an error instead.
+    """
+    if settings.AI_RULE_PRECHECK_ENABLED:
+        report = check_post(post, subreddit_rules)
+        if report.compliant:
+            AI_RULE_PRECHECKS.labels(outcome="compliant").inc()
+            for chunk in report.formatted().render():
+                yield chunk
+            yield "[DONE]"
+            return
+        AI_RULE_PRECHECKS.labels(outcome="model").inc()
+        if report.fixed:
+            post = f"{report.title}\n\n{report.body}"
+
+    use_edits = settings.AI_FORMAT_EDITS_ENABLED and len(post) >= settings.AI_FORMAT_EDITS_MIN_CHARS
+    try:
+        full_prompt = create_format_post_for_subreddit_prompt(post, subreddit, subreddit_rules)
+        edits_prompt = create_format_post_edits_prompt(post, subreddit, subreddit_rules) if use_edits else None
+    except PostTooLong:
+        yield f"Error: Post is too long to format for r/{subreddit}"
+        return
+
+    if edits_prompt is None:
+        async for chunk in stream_model_response(full_prompt, use_cache):
+            yield chunk
+        return
+
+    response = []
+    completed = False
+    async for chunk in stream_model_response(edits_prompt, use_cache):
+        if is_queue_event(chunk):
+            yield chunk
+            continue
         if chunk.startswith("Error:"):
             yield chunk
             return
         if chunk == "[DONE]":
-            subreddit_names = re.findall(subreddit_pattern, text, re.MULTILINE)
-            yield f"data: {{\"subreddits\": {json.dumps(subreddit_names)}}}"
+            completed = True
             break
-        text += chunk
+        response.append(chunk)
+
+    try:
+        if not completed:
+            raise PostEditError("Edits response was interrupted")
+        formatted = apply_post_edits(post, "".join(response))
+    except PostEditError as e:
+        logging.warning(f"Falling back to full rewrite for r/{subreddit}: {e}")
+        AI_FORMAT_EDITS.labels(result="fallback").inc()
+        async for chunk in stream_model_response(full_prompt, use_cache):
+            yield chunk
+        return
+
+    AI_FORMAT_EDITS.labels(result="applied").inc()
+    for chunk in formatted.render():
         yield chunk
+    yield "[DONE]"
 
 
-async def stream_subreddits_suggestion_and_rules_formatted(prompt: str) -> AsyncGenerator[str, None]:
-    subreddits = []
-    async for chunk in stream_subreddits_suggestion_and_rules(prompt):
-        if chunk.startswith("data: {\"subreddits\":"):
-            # Извлекаем список сабреддитов из финального чанка
-            subreddits = json.loads(chunk[6:])["subreddits"]
+class SubredditRulesFetcher:
+    """
+    Fetches rules for subreddits as they are added, at most
+    SUBREDDIT_RULES_CONCURRENCY at a time and each bounded by SUBREDDIT_RULES_TIMEOUT.
+    """
+
+    def __init__(self):
+        self._semaphore = asyncio.Semaphore(settings.SUBREDDIT_RULES_CONCURRENCY)
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def add(self, subreddit: str) -> None:
+        if subreddit not in self._tasks:
+            self._tasks[subreddit] = asyncio.create_task(self._fetch(subreddit))
+
+    async def get(self, subreddit: str) -> str:
+        self.add(subreddit)
+        # Задача общая для всех, кто ждёт эти правила: отмена одного ожидающего её не трогает
+        return await asyncio.shield(self._tasks[subreddit])
+
+    async def _fetch(self, subreddit: str) -> str:
+        async with self._semaphore:
+            try:
+                return await asyncio.wait_for(
+                    get_subreddit_rules(subreddit),
+                    timeout=settings.SUBREDDIT_RULES_TIMEOUT,
+                )
+            except asyncio.TimeoutError:
+                logging.error(f"Timed out fetching rules for r/{subreddit}")
+                return json.dumps({
+                    "name": subreddit,
+                    "status": "failed",
+                })
+
+    async def results(self, subreddits: list[str] | None = None) -> AsyncGenerator[str, None]:
+        """Yields the rules of the given subreddits (all added ones by default) as soon as they are ready."""
+        names = list(self._tasks) if subreddits is None else subreddits
+        for next_done in asyncio.as_completed([self._tasks[name] for name in names]):
+            yield await next_done
+
+    def cancel(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+
+
+async def stream_subreddits_suggestion_and_rules(
+    post: str,
+    prompt: Optional[str],
+    on_subreddit: Callable[[str], None] | None = None,
+    use_cache: bool = True,
+    mode: str = LLM,
+) -> AsyncGenerator[SSEEvent, None]:
+    """
+    Streams the model suggestion as token events plus a typed suggestion event
+    as soon as each entry is complete. Every suggested subreddit is also reported
+    to on_subreddit, so callers can start work before the model finishes.
+    """
+    parser = SuggestionParser()
+    async for chunk in stream_suggestion_response(post, prompt, use_cache, mode):
+        event = model_chunk_event(chunk)
+        if event.event == ERROR:
+            yield event
+            return
+        if event.event == QUEUE:
+            yield event
+            continue
+        if event.event == DONE:
+            suggestions = parser.finish()
         else:
-            yield chunk
-    yield "\ndata: [DONEAI]\n\n"
+            suggestions = parser.feed(chunk)
+            yield event
+        for suggestion in suggestions:
+            if on_subreddit is not None:
+                on_subreddit(suggestion.name)
+            yield SSEEvent(SUGGESTION, json.dumps(suggestion.as_dict()))
+        if event.event == DONE:
+            break
+
+
+async def _suggestion_and_rules_events(
+    post: str,
+    prompt: Optional[str],
+    fetcher: SubredditRulesFetcher,
+    use_cache: bool = True,
+    mode: str = LLM,
+) -> AsyncGenerator[SSEEvent, None]:
+    subreddits: list[str] = []
+
+    def on_subreddit(subreddit: str) -> None:
+        subreddits.append(subreddit)
+        fetcher.add(subreddit)
+
+    async for event in stream_subreddits_suggestion_and_rules(post, prompt, on_subreddit=on_subreddit, use_cache=use_cache, mode=mode):
+        yield event
+    yield SSEEvent(DONE_AI, "[DONEAI]")
+    async for result in fetcher.results(subreddits):
+        yield SSEEvent(RULES, result)
+    yield SSEEvent(DONE, "[DONE]")
+
+
+async def stream_subreddits_suggestion_and_rules_formatted(
+    post: str,
+    prompt: Optional[str],
+    use_cache: bool = True,
+    mode: str = LLM,
+) -> AsyncGenerator[SSEEvent, None]:
+    """
+    Streams the suggestion as token and suggestion events, then [DONEAI], then one rules event
+    per suggested subreddit as soon as its rules are fetched, then [DONE].
+    Without a prompt the suggestion comes from the vector matcher instead of the model.
+    """
+    fetcher = SubredditRulesFetcher()
+    try:
+        async for event in _suggestion_and_rules_events(post, prompt, fetcher, use_cache, mode):
+            yield event
+    finally:
+        fetcher.cancel()
+
+
+_ITEM_END = object()
+
+
+async def _multiplex(
+    sources: list[tuple[int | str, Callable[[], AsyncGenerator[SSEEvent, None]]]],
+    concurrency: int,
+) -> AsyncGenerator[SSEEvent, None]:
+    """
+    Runs the event sources at most concurrency at a time and interleaves their events
+    tagged with the source's stream. A failed source gets an error and its own [DONE].
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=16)
+
+    async def run(stream: int | str, source_factory: Callable[[], AsyncGenerator[SSEEvent, None]]) -> None:
+        try:
+            async with semaphore:
+                async for event in source_factory():
+                    event.stream = stream
+                    await queue.put(event)
+        except Exception as e:
+            logging.error(e)
+            await queue.put(SSEEvent(ERROR, f"Error: Request failed - {str(e)}", stream))
+            await queue.put(SSEEvent(DONE, "[DONE]", stream))
+        await queue.put(_ITEM_END)
+
+    tasks = [asyncio.create_task(run(stream, source_factory)) for stream, source_factory in sources]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event = await queue.get()
+            if event is _ITEM_END:
+                remaining -= 1
+                continue
+            yield event
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def stream_batch_suggestions(
+    items: list[tuple[str, str]],
+    use_cache: bool = True,
+) -> AsyncGenerator[SSEEvent, None]:
+    """
+    Runs the suggestion pipeline for each (post, prompt) pair, at most AI_BATCH_CONCURRENCY
+    at a time, and interleaves their events tagged with the item index as the stream.
+    Rules of subreddits suggested for several posts are fetched once for the whole batch.
+    Ends with an untagged [DONE] after every item has sent its own.
+    """
+    fetcher = SubredditRulesFetcher()
+    sources = [
+        (index, lambda post=post, prompt=prompt: _suggestion_and_rules_events(post, prompt, fetcher, use_cache))
+        for index, (post, prompt) in enumerate(items)
+    ]
+    try:
+        async for event in _multiplex(sources, settings.AI_BATCH_CONCURRENCY):
+            yield event
+        yield SSEEvent(DONE, "[DONE]")
+    finally:
+        fetcher.cancel()
+
+
+def _has_rules(rules: str) -> bool:
+    try:
+        data = json.loads(rules)
+    except ValueError:
+        return False
+    return data.get("status") == "success" and bool(data.get("rules"))
+
+
+async def _format_events(
+    post: str,
+    subreddit: str,
+    fetcher: SubredditRulesFetcher,
+    use_cache: bool = True,
+) -> AsyncGenerator[SSEEvent, None]:
+    rules = await fetcher.get(subreddit)
+    yield SSEEvent(RULES, rules)
+    if not _has_rules(rules):
+        yield SSEEvent(ERROR, "Error: Subreddit not found or has no rules")
+        yield SSEEvent(DONE, "[DONE]")
+        return
+
+    async for chunk in stream_formatted_post(post, subreddit, rules, use_cache):
+        event = model_chunk_event(chunk)
+        if event.event == DONE:
+            break
+        yield event
+        if event.event == ERROR:
+            break
+    yield SSEEvent(DONE, "[DONE]")
+
+
+async def stream_format_for_subreddits(
+    post: str,
+    subreddits: list[str],
+    use_cache: bool = True,
+) -> AsyncGenerator[SSEEvent, None]:
+    """
+    Formats the post for every subreddit in one stream. All rule sets are fetched at once,
+    at most AI_BATCH_CONCURRENCY generations run in parallel, and each subreddit's
+    rules, tokens and [DONE] are tagged with its name as the stream.
+    Ends with an untagged [DONE].
+    """
+    fetcher = SubredditRulesFetcher()
     for subreddit in subreddits:
-        result = await get_subreddit_rules(subreddit)
-        yield result
-    yield "\ndata: [DONE]\n\n"
\ No newline at end of file
+        fetcher.add(subreddit)
+    sources = [
+        (subreddit, lambda subreddit=subreddit: _format_events(post, subreddit, fetcher, use_cache))
+        for subreddit in subreddits
+    ]
+    try:
+        async for event in _multiplex(sources, settings.AI_BATCH_CONCURRENCY):
+            yield event
+        yield SSEEvent(DONE, "[DONE]")
+    finally:
+        fetcher.cancel()
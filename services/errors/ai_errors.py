@@ -0,0 +1,39 @@
+from fastapi import FastAPI, status
+from .permission_errors import BaseException
+from .utils import create_exception_handler
+
+
+class PostTooLong(BaseException):
+    """Post doesn't leave room for the subreddit rules in the model's prompt"""
+
+    pass
+
+
+class AnalysisJobNotFound(BaseException):
+    """Analysis job does not exist or its results have expired"""
+
+    pass
+
+
+def register_ai_errors(app: FastAPI):
+    app.add_exception_handler(
+        PostTooLong,
+        create_exception_handler(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            initial_detail={
+                "message": "Post is too long to format",
+                "error_code": "post_too_long",
+            },
+        ),
+    )
+
+    app.add_exception_handler(
+        AnalysisJobNotFound,
+        create_exception_handler(
+            status_code=status.HTTP_404_NOT_FOUND,
+            initial_detail={
+                "message": "Analysis job not found",
+                "error_code": "analysis_job_not_found",
+            },
+        ),
+    )
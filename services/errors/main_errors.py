@@ -3,6 +3,7 @@ from fastapi import status
 from sqlalchemy.exc import SQLAlchemyError
 from fastapi import FastAPI
 from .permission_errors import register_permission_errors
+from .ai_errors import register_ai_errors
 
 
 def register_all_errors(app: FastAPI):
@@ -10,6 +11,7 @@ def register_all_errors(app: FastAPI):
     # add here your error register functions ------>
 
     register_permission_errors(app)
+    register_ai_errors(app)
 
     # <------
 
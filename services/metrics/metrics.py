@@ -0,0 +1,189 @@
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, make_asgi_app, multiprocess
+import os
+
+
+# С несколькими воркерами uvicorn/gunicorn каждый процесс пишет метрики в PROMETHEUS_MULTIPROC_DIR,
+# а /metrics собирает их из всех процессов. Каталог нужно очищать перед каждым запуском сервера.
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+
+def make_metrics_app():
+    """ASGI app for /metrics: every worker's metrics in multiprocess mode, this process's otherwise."""
+    if not MULTIPROCESS:
+        return make_asgi_app()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return make_asgi_app(registry)
+
+
+def mark_metrics_process_dead() -> None:
+    """Drops this worker's live gauges from the multiprocess metrics when it exits."""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+SUBREDDIT_RULES_CACHE_HITS = Counter(
+    "subreddit_rules_cache_hits_total",
+    "Subreddit rules served from the Redis cache",
+    ["freshness"],
+)
+
+SUBREDDIT_RULES_CACHE_MISSES = Counter(
+    "subreddit_rules_cache_misses_total",
+    "Subreddit rules requests that had to go to Reddit",
+)
+
+AI_HTTP_POOL_CONNECTIONS = Gauge(
+    "ai_http_pool_connections",
+    "Connections in the shared AI provider HTTP pool",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+
+AI_RESPONSE_CACHE_HITS = Counter(
+    "ai_response_cache_hits_total",
+    "Model responses replayed from the Redis cache",
+)
+
+AI_RESPONSE_CACHE_MISSES = Counter(
+    "ai_response_cache_misses_total",
+    "Model responses that required a new generation",
+)
+
+SIMILAR_POST_HITS = Counter(
+    "similar_post_hits_total",
+    "Subreddit suggestions reused from a near-duplicate post",
+)
+
+SIMILAR_POST_MISSES = Counter(
+    "similar_post_misses_total",
+    "Posts with no near-duplicate in the similarity index",
+)
+
+AI_COALESCED_STREAMS = Counter(
+    "ai_coalesced_streams_total",
+    "Model streams served by joining an identical in-flight generation",
+    ["scope"],
+)
+
+SSE_CLIENT_DISCONNECTS = Counter(
+    "sse_client_disconnects_total",
+    "Streaming responses cancelled because the client went away",
+    ["endpoint"],
+)
+
+AI_CANCELLED_GENERATIONS = Counter(
+    "ai_cancelled_generations_total",
+    "Upstream model generations cancelled before completion",
+)
+
+AI_CANCELLED_GENERATION_CHUNKS = Counter(
+    "ai_cancelled_generation_chunks_total",
+    "Chunks already generated by upstream generations that were later cancelled",
+)
+
+AI_ADMISSION_REJECTED = Counter(
+    "ai_admission_rejected_total",
+    "Model requests shed because the upstream wait queue was full or the wait timed out",
+    ["reason"],
+)
+
+AI_ADMISSION_WAIT_SECONDS = Histogram(
+    "ai_admission_wait_seconds",
+    "Time spent waiting in the queue for an upstream model slot",
+)
+
+AI_PROVIDER_TTFT_SECONDS = Histogram(
+    "ai_provider_ttft_seconds",
+    "Time to first token per model provider",
+    ["provider"],
+)
+
+AI_PROVIDER_ERRORS = Counter(
+    "ai_provider_errors_total",
+    "Failed generations per model provider",
+    ["provider"],
+)
+
+AI_HEDGED_REQUESTS = Counter(
+    "ai_hedged_requests_total",
+    "Generations that started a second provider because the first was slow",
+    ["winner"],
+)
+
+CIRCUIT_REJECTED = Counter(
+    "circuit_rejected_total",
+    "Upstream calls skipped because the circuit breaker was open",
+    ["upstream"],
+)
+
+UPSTREAM_RETRIES = Counter(
+    "upstream_retries_total",
+    "Retried upstream calls",
+    ["upstream"],
+)
+
+AI_FORMAT_EDITS = Counter(
+    "ai_format_edits_total",
+    "Posts formatted from model edits, by result",
+    ["result"],
+)
+
+AI_RULE_PRECHECKS = Counter(
+    "ai_rule_prechecks_total",
+    "Posts checked against compiled subreddit rules before formatting, by outcome",
+    ["outcome"],
+)
+
+SUBREDDIT_CATALOG_ENTRIES = Gauge(
+    "subreddit_catalog_entries",
+    "Subreddits in the loaded offline catalog",
+    multiprocess_mode="livemax",
+)
+
+SUBREDDIT_RULES_LOCAL_HITS = Counter(
+    "subreddit_rules_local_hits_total",
+    "Subreddit rules served without Redis, by cache tier",
+    ["tier"],
+)
+
+SUBREDDIT_EXISTENCE_CHECKS = Counter(
+    "subreddit_existence_checks_total",
+    "Subreddit existence checks, by where the answer came from",
+    ["source", "result"],
+)
+
+REDDIT_RATELIMIT_REMAINING = Gauge(
+    "reddit_ratelimit_remaining",
+    "Requests left in the current Reddit rate-limit window, as last reported by Reddit",
+    multiprocess_mode="mostrecent",
+)
+
+REDDIT_RATELIMIT_USED = Gauge(
+    "reddit_ratelimit_used",
+    "Requests used in the current Reddit rate-limit window, as last reported by Reddit",
+    multiprocess_mode="mostrecent",
+)
+
+REDDIT_RATELIMIT_RESET_SECONDS = Gauge(
+    "reddit_ratelimit_reset_seconds",
+    "Seconds until the Reddit rate-limit window resets, as last reported by Reddit",
+    multiprocess_mode="mostrecent",
+)
+
+REDDIT_RATELIMIT_WAIT_SECONDS = Histogram(
+    "reddit_ratelimit_wait_seconds",
+    "Time Reddit requests waited for the shared rate-limit budget",
+    ["priority"],
+)
+
+REDDIT_RATELIMIT_REJECTED = Counter(
+    "reddit_ratelimit_rejected_total",
+    "Reddit requests given up because the budget would not allow them in time",
+    ["priority"],
+)
+
+REDDIT_RATELIMIT_THROTTLED = Counter(
+    "reddit_ratelimit_throttled_total",
+    "Reddit responses with status 429",
+)
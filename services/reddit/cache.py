@@ -0,0 +1,235 @@
+from core.config import settings
+from database.redis import redis
+from services.metrics.metrics import SUBREDDIT_RULES_CACHE_HITS, SUBREDDIT_RULES_CACHE_MISSES, SUBREDDIT_RULES_LOCAL_HITS
+from services.reddit.metadata_store import get_subreddit_metadata
+from services.reddit.rate_limit import BACKGROUND, reddit_priority
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+import asyncio
+import json
+import logging
+import time
+import uuid
+
+
+RULES_KEY_PREFIX = "subreddit_rules:"
+RULES_LOCK_PREFIX = "subreddit_rules_lock:"
+
+# Фоновые обновления держим здесь, чтобы задачи не собрал GC до завершения
+_background_refreshes: set[asyncio.Task] = set()
+
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+# L1: правила, недавно полученные этим воркером, на время не дольше их свежести
+_local_rules: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+
+def _local_get(subreddit_name: str) -> Optional[str]:
+    key = subreddit_name.lower()
+    entry = _local_rules.get(key)
+    if entry is None:
+        return None
+    expires_at, rules = entry
+    if expires_at <= time.time():
+        del _local_rules[key]
+        return None
+    _local_rules.move_to_end(key)
+    return rules
+
+
+def _local_put(subreddit_name: str, rules: str, fresh_until: float) -> None:
+    expires_at = min(fresh_until, time.time() + settings.SUBREDDIT_RULES_LOCAL_TTL)
+    if settings.SUBREDDIT_RULES_LOCAL_SIZE <= 0 or expires_at <= time.time():
+        return
+    _local_rules[subreddit_name.lower()] = (expires_at, rules)
+    _local_rules.move_to_end(subreddit_name.lower())
+    while len(_local_rules) > settings.SUBREDDIT_RULES_LOCAL_SIZE:
+        _local_rules.popitem(last=False)
+
+
+def _shared_get(subreddit_name: str) -> Optional[tuple[float, str]]:
+    """L1.5: fresh rules from the memory-mapped snapshot shared by the workers of this host."""
+    record = get_subreddit_metadata(subreddit_name)
+    if record is None or record.rules is None:
+        return None
+    fresh_until = record.fetched_at + settings.SUBREDDIT_RULES_CACHE_TTL
+    if fresh_until <= time.time():
+        return None
+    return fresh_until, record.rules
+
+
+def _rules_key(subreddit_name: str) -> str:
+    return f"{RULES_KEY_PREFIX}{subreddit_name.lower()}"
+
+
+def _lock_key(subreddit_name: str) -> str:
+    return f"{RULES_LOCK_PREFIX}{subreddit_name.lower()}"
+
+
+def _is_failed(rules: str) -> bool:
+    try:
+        return json.loads(rules).get("status") != "success"
+    except ValueError:
+        return True
+
+
+async def _read_entry(subreddit_name: str) -> Optional[dict]:
+    try:
+        raw = await redis.get(_rules_key(subreddit_name))
+    except Exception as e:
+        logging.error(e)
+        return None
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
+
+
+async def _write_entry(subreddit_name: str, rules: str) -> None:
+    if _is_failed(rules):
+        fresh_ttl = settings.SUBREDDIT_RULES_CACHE_FAILED_TTL
+        expire = fresh_ttl
+    else:
+        fresh_ttl = settings.SUBREDDIT_RULES_CACHE_TTL
+        expire = fresh_ttl + settings.SUBREDDIT_RULES_CACHE_STALE_TTL
+
+    entry = {
+        "rules": rules,
+        "fresh_until": time.time() + fresh_ttl,
+    }
+    _local_put(subreddit_name, rules, entry["fresh_until"])
+    try:
+        await redis.setex(_rules_key(subreddit_name), expire, json.dumps(entry))
+    except Exception as e:
+        logging.error(e)
+
+
+async def _acquire_lock(subreddit_name: str) -> Optional[str]:
+    token = uuid.uuid4().hex
+    try:
+        acquired = await redis.set(
+            _lock_key(subreddit_name),
+            token,
+            nx=True,
+            ex=settings.SUBREDDIT_RULES_CACHE_LOCK_TTL,
+        )
+    except Exception as e:
+        logging.error(e)
+        # Redis недоступен — ходим в Reddit без координации
+        return token
+    return token if acquired else None
+
+
+async def _release_lock(subreddit_name: str, token: str) -> None:
+    try:
+        await redis.eval(_RELEASE_LOCK_SCRIPT, 1, _lock_key(subreddit_name), token)
+    except Exception as e:
+        logging.error(e)
+
+
+async def _load_and_store(
+    subreddit_name: str,
+    loader: Callable[[str], Awaitable[str]],
+    token: str,
+) -> str:
+    try:
+        rules = await loader(subreddit_name)
+        await _write_entry(subreddit_name, rules)
+        return rules
+    finally:
+        await _release_lock(subreddit_name, token)
+
+
+async def _refresh_in_background(subreddit_name: str, loader: Callable[[str], Awaitable[str]]) -> None:
+    token = await _acquire_lock(subreddit_name)
+    if token is None:
+        # Обновление уже идёт в другом запросе или воркере
+        return
+    # Фоновое обновление не должно отнимать у пользовательских запросов бюджет Reddit
+    with reddit_priority(BACKGROUND):
+        task = asyncio.create_task(_load_and_store(subreddit_name, loader, token))
+    _background_refreshes.add(task)
+    task.add_done_callback(_background_refreshes.discard)
+
+
+async def _wait_for_entry(subreddit_name: str) -> Optional[dict]:
+    """
+    Ждёт, пока владелец блокировки положит правила в кеш.
+    Возвращает None, если блокировка исчезла или истекла без результата.
+    """
+    deadline = time.monotonic() + settings.SUBREDDIT_RULES_CACHE_LOCK_TTL
+    delay = 0.05
+    while time.monotonic() < deadline:
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.5)
+        entry = await _read_entry(subreddit_name)
+        if entry is not None:
+            return entry
+        try:
+            if not await redis.exists(_lock_key(subreddit_name)):
+                return await _read_entry(subreddit_name)
+        except Exception as e:
+            logging.error(e)
+            return None
+    return None
+
+
+async def get_or_load_subreddit_rules(
+    subreddit_name: str,
+    loader: Callable[[str], Awaitable[str]],
+) -> str:
+    """
+    Возвращает правила сабреддита из кеша, обращаясь к Reddit только при необходимости.
+    Сначала смотрит в память воркера, затем в общий для воркеров хоста снимок в mmap, затем в Redis.
+    Свежая запись отдаётся сразу; устаревшая отдаётся сразу и обновляется в фоне;
+    при промахе параллельные запросы всех воркеров ждут одну загрузку через блокировку в Redis.
+    Args:
+        subreddit_name: название сабреддита.
+        loader: корутина, получающая правила из Reddit.
+    Returns:
+        JSON-строка с правилами, в том же формате, что возвращает loader.
+    """
+    rules = _local_get(subreddit_name)
+    if rules is not None:
+        SUBREDDIT_RULES_LOCAL_HITS.labels(tier="process").inc()
+        return rules
+
+    shared = _shared_get(subreddit_name)
+    if shared is not None:
+        SUBREDDIT_RULES_LOCAL_HITS.labels(tier="mmap").inc()
+        fresh_until, rules = shared
+        _local_put(subreddit_name, rules, fresh_until)
+        return rules
+
+    entry = await _read_entry(subreddit_name)
+    if entry is not None:
+        if entry["fresh_until"] > time.time():
+            SUBREDDIT_RULES_CACHE_HITS.labels(freshness="fresh").inc()
+            _local_put(subreddit_name, entry["rules"], entry["fresh_until"])
+        else:
+            SUBREDDIT_RULES_CACHE_HITS.labels(freshness="stale").inc()
+            await _refresh_in_background(subreddit_name, loader)
+        return entry["rules"]
+
+    SUBREDDIT_RULES_CACHE_MISSES.inc()
+
+    token = await _acquire_lock(subreddit_name)
+    if token is not None:
+        return await _load_and_store(subreddit_name, loader, token)
+
+    entry = await _wait_for_entry(subreddit_name)
+    if entry is not None:
+        return entry["rules"]
+
+    # Владелец блокировки не записал результат вовремя — загружаем сами
+    rules = await loader(subreddit_name)
+    await _write_entry(subreddit_name, rules)
+    return rules
@@ -0,0 +1,105 @@
+from core.config import settings
+from services.ai.bm25 import BM25Index
+from services.metrics.metrics import SUBREDDIT_CATALOG_ENTRIES
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Iterator, Optional
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+
+
+@dataclass
+class CatalogEntry:
+    name: str
+    description: str
+    subscribers: int
+    rules_hash: Optional[str]
+
+
+class SubredditCatalog:
+    """Subreddits from a catalog dump with a BM25 index over their names and descriptions."""
+
+    def __init__(self, entries: list[CatalogEntry]):
+        self.entries = entries
+        self._by_name = {entry.name.lower(): entry for entry in entries}
+        # Название повторяем, чтобы совпадение с ним весило больше, чем с описанием
+        self._index = BM25Index(f"{entry.name} {entry.name} {entry.description}" for entry in entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @cached_property
+    def fingerprint(self) -> str:
+        """Digest of the names and descriptions, changes whenever the catalog content does."""
+        digest = hashlib.sha256()
+        for entry in self.entries:
+            digest.update(f"{entry.name}\0{entry.description}\0".encode())
+        return digest.hexdigest()
+
+    def get(self, name: str) -> Optional[CatalogEntry]:
+        return self._by_name.get(name.lower())
+
+    def candidates(self, post: str, limit: int) -> list[CatalogEntry]:
+        # При равном счёте выше тот сабреддит, где больше подписчиков
+        found = self._index.search(post, limit * 2)
+        found.sort(key=lambda item: (-round(item[1], 6), -self.entries[item[0]].subscribers))
+        return [self.entries[doc_id] for doc_id, _ in found[:limit]]
+
+
+def read_lines(path: str) -> Iterator[str]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as file:
+        yield from file
+
+
+def read_catalog(path: str) -> list[CatalogEntry]:
+    """
+    Reads a catalog dump: JSON Lines (optionally gzipped), one subreddit per line
+    with name, description, subscribers and rules_hash. Malformed lines are skipped.
+    """
+    entries = []
+    for line in read_lines(path):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            entries.append(CatalogEntry(
+                name=str(item["name"]).removeprefix("r/"),
+                description=str(item.get("description") or ""),
+                subscribers=int(item.get("subscribers") or 0),
+                rules_hash=item.get("rules_hash"),
+            ))
+        except (ValueError, KeyError, TypeError) as e:
+            logging.error(f"Skipping catalog line: {e}")
+    return entries
+
+
+_catalog: Optional[SubredditCatalog] = None
+
+
+async def load_subreddit_catalog() -> None:
+    """Builds the catalog from SUBREDDIT_CATALOG_PATH off the event loop and swaps it in."""
+    global _catalog
+    if not settings.SUBREDDIT_CATALOG_PATH:
+        return
+    try:
+        catalog = await asyncio.to_thread(lambda: SubredditCatalog(read_catalog(settings.SUBREDDIT_CATALOG_PATH)))
+    except Exception as e:
+        logging.error(e)
+        return
+    _catalog = catalog
+    SUBREDDIT_CATALOG_ENTRIES.set(len(catalog))
+
+
+def get_subreddit_catalog() -> Optional[SubredditCatalog]:
+    return _catalog
+
+
+def subreddit_candidates(post: str, limit: int | None = None) -> list[CatalogEntry]:
+    """Top catalog subreddits for the post, or [] when no catalog is loaded."""
+    if _catalog is None:
+        return []
+    return _catalog.candidates(post, limit or settings.SUBREDDIT_CATALOG_CANDIDATES)
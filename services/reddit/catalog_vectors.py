@@ -0,0 +1,201 @@
+from core.config import settings
+from services.ai.bm25 import tokenize
+from services.reddit.catalog import CatalogEntry, SubredditCatalog, get_subreddit_catalog
+from typing import Iterable, Optional
+import asyncio
+import json
+import logging
+import math
+import numpy as np
+import os
+import zlib
+
+
+def _features(text: str) -> dict[str, int]:
+    words = tokenize(text)
+    features: dict[str, int] = {}
+    for feature in (*words, *(f"{a} {b}" for a, b in zip(words, words[1:]))):
+        features[feature] = features.get(feature, 0) + 1
+    return features
+
+
+def _hashed(texts: Iterable[str], dim: int) -> np.ndarray:
+    """
+    Sublinear term frequencies of words and word bigrams, feature-hashed into dim signed buckets.
+    The sign comes from another bit of the hash, so colliding features tend to cancel out.
+    """
+    rows, columns, values = [], [], []
+    count = 0
+    for row, text in enumerate(texts):
+        count += 1
+        for feature, tf in _features(text).items():
+            hashed = zlib.crc32(feature.encode())
+            rows.append(row)
+            columns.append(hashed % dim)
+            values.append((1.0 + math.log(tf)) * (1.0 if hashed & 0x80000000 else -1.0))
+    matrix = np.zeros((count, dim), dtype=np.float32)
+    np.add.at(matrix, (np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64)), np.array(values, dtype=np.float32))
+    return matrix
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class CatalogVectors:
+    """
+    Hashed TF-IDF vectors of catalog subreddits, one L2-normalized float32 row per entry,
+    so the dot product with an embedded post is their cosine similarity.
+    The matrix is usually a read-only memmap shared by all workers through the page cache.
+    """
+
+    def __init__(self, matrix: np.ndarray, idf: np.ndarray):
+        self.matrix = matrix
+        self.idf = idf
+
+    @classmethod
+    def build(cls, texts: list[str], dim: int) -> "CatalogVectors":
+        counts = _hashed(texts, dim)
+        df = np.count_nonzero(counts, axis=0)
+        idf = (np.log((1 + len(texts)) / (1 + df)) + 1).astype(np.float32)
+        return cls(_normalize(counts * idf), idf)
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1]
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        return _normalize(_hashed(texts, self.dim) * self.idf)
+
+    def top_k(self, queries: np.ndarray, k: int) -> list[list[tuple[int, float]]]:
+        """Best k (row, cosine) pairs for every query row, with one matrix product for the whole batch."""
+        scores = self.matrix @ queries.T
+        k = min(k, scores.shape[0])
+        results = []
+        for column in scores.T:
+            best = np.argpartition(column, -k)[-k:]
+            best = best[np.argsort(column[best])[::-1]]
+            results.append([(int(row), float(column[row])) for row in best])
+        return results
+
+
+def _document(entry: CatalogEntry) -> str:
+    return f"{entry.name} {entry.description}"
+
+
+def save_vectors(path: str, vectors: CatalogVectors, fingerprint: str) -> None:
+    """Writes the matrix and its metadata next to each other and swaps them in atomically."""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        np.save(file, vectors.matrix)
+    with open(f"{temporary}.json", "w") as file:
+        json.dump({"fingerprint": fingerprint, "idf": vectors.idf.tolist()}, file)
+    os.replace(temporary, path)
+    os.replace(f"{temporary}.json", f"{path}.json")
+
+
+def load_vectors(path: str, fingerprint: str, rows: int, dim: int) -> Optional[CatalogVectors]:
+    """Memory-maps saved vectors if they were built for this catalog and dimension."""
+    try:
+        with open(f"{path}.json") as file:
+            meta = json.load(file)
+        matrix = np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    if meta.get("fingerprint") != fingerprint or matrix.shape != (rows, dim):
+        return None
+    return CatalogVectors(matrix, np.array(meta["idf"], dtype=np.float32))
+
+
+def _vectors_path() -> str:
+    return settings.SUBREDDIT_VECTORS_PATH or f"{settings.SUBREDDIT_CATALOG_PATH}.vectors.npy"
+
+
+def _load_or_build(catalog: SubredditCatalog) -> CatalogVectors:
+    path = _vectors_path()
+    fingerprint = catalog.fingerprint
+    vectors = load_vectors(path, fingerprint, len(catalog), settings.SUBREDDIT_VECTORS_DIM)
+    if vectors is not None:
+        return vectors
+    built = CatalogVectors.build([_document(entry) for entry in catalog.entries], settings.SUBREDDIT_VECTORS_DIM)
+    try:
+        save_vectors(path, built, fingerprint)
+    except OSError as e:
+        logging.error(e)
+        return built
+    return load_vectors(path, fingerprint, len(catalog), settings.SUBREDDIT_VECTORS_DIM) or built
+
+
+class VectorMatcher:
+    """
+    Ranks catalog subreddits for posts. Posts arriving within SUBREDDIT_VECTORS_BATCH_WINDOW
+    of each other are embedded and scored together in one matrix product off the event loop,
+    so the catalog matrix is read once per batch instead of once per request.
+    """
+
+    def __init__(self, catalog: SubredditCatalog, vectors: CatalogVectors):
+        self.catalog = catalog
+        self.vectors = vectors
+        self._pending: list[tuple[str, int, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Пачки держим здесь, чтобы задачи не собрал GC и ожидающие запросы не повисли
+        self._batches: set[asyncio.Task] = set()
+
+    async def match(self, post: str, limit: int) -> list[tuple[CatalogEntry, float]]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((post, limit, future))
+        if len(self._pending) >= settings.SUBREDDIT_VECTORS_MAX_BATCH:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(settings.SUBREDDIT_VECTORS_BATCH_WINDOW, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    def _score(self, posts: list[str], limit: int) -> list[list[tuple[int, float]]]:
+        return self.vectors.top_k(self.vectors.embed(posts), limit)
+
+    async def _run(self, batch: list[tuple[str, int, asyncio.Future]]) -> None:
+        try:
+            results = await asyncio.to_thread(self._score, [post for post, _, _ in batch], max(limit for _, limit, _ in batch))
+        except Exception as e:
+            logging.error(e)
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, limit, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result([(self.catalog.entries[row], score) for row, score in result[:limit]])
+
+
+_matcher: Optional[VectorMatcher] = None
+
+
+async def load_catalog_vectors() -> None:
+    """Memory-maps the catalog vectors, building and saving them first if they are missing or stale."""
+    global _matcher
+    catalog = get_subreddit_catalog()
+    if catalog is None or not len(catalog):
+        return
+    try:
+        vectors = await asyncio.to_thread(_load_or_build, catalog)
+    except Exception as e:
+        logging.error(e)
+        return
+    _matcher = VectorMatcher(catalog, vectors)
+
+
+def get_vector_matcher() -> Optional[VectorMatcher]:
+    return _matcher
@@ -0,0 +1,233 @@
+from core.config import settings
+from database.redis import redis
+from services.metrics.metrics import SUBREDDIT_EXISTENCE_CHECKS
+from services.reddit.catalog import get_subreddit_catalog, read_lines
+from services.reddit.metadata_store import get_subreddit_metadata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Iterable, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import numpy as np
+import re
+import time
+
+
+EXISTS_KEY_PREFIX = "subreddit_exists:"
+
+# Имена сабреддитов: латиница, цифры и подчёркивание, не с подчёркивания, до 21 символа
+_VALID_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9_]{1,20}")
+
+
+def is_valid_subreddit_name(name: str) -> bool:
+    return _VALID_NAME.fullmatch(name) is not None
+
+
+_MASK = (1 << 64) - 1
+
+
+def _hash_pair(name: str) -> tuple[int, int]:
+    # Двойное хеширование: k позиций из двух половин одного дайджеста
+    digest = hashlib.blake2b(name.lower().encode(), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over lower-cased names. Lookups never miss an added name
+    and report a name that was not added with probability about error_rate.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, name: str) -> Iterable[int]:
+        first, second = _hash_pair(name)
+        # Арифметика по модулю 2**64, как в uint64 у add_all
+        return (((first + i * second) & _MASK) % self.size for i in range(self.hashes))
+
+    def add(self, name: str) -> None:
+        for position in self._positions(name):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def add_all(self, names: list[str]) -> None:
+        """Adds many names at once, computing the bit positions with NumPy."""
+        pairs = np.array([_hash_pair(name) for name in names], dtype=np.uint64).reshape(-1, 2)
+        bits = np.unpackbits(np.frombuffer(self._bits, dtype=np.uint8), bitorder="little").astype(bool)
+        for i in range(self.hashes):
+            bits[(pairs[:, 0] + np.uint64(i) * pairs[:, 1]) % np.uint64(self.size)] = True
+        self._bits = bytearray(np.packbits(bits, bitorder="little").tobytes())
+
+    def __contains__(self, name: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(name))
+
+
+def read_subreddit_names(path: str) -> list[str]:
+    """Reads names from a plain list (one per line) or from a catalog dump in JSON Lines."""
+    names = []
+    for line in read_lines(path):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            try:
+                line = str(json.loads(line)["name"])
+            except (ValueError, KeyError, TypeError):
+                continue
+        name = line.removeprefix("r/")
+        if is_valid_subreddit_name(name):
+            names.append(name)
+    return names
+
+
+def build_bloom_filter(names: list[str], error_rate: float) -> BloomFilter:
+    bloom = BloomFilter(len(names), error_rate)
+    bloom.add_all(names)
+    return bloom
+
+
+_known_names: Optional[BloomFilter] = None
+
+
+async def load_subreddit_names() -> None:
+    """Builds the Bloom filter of known subreddits from SUBREDDIT_NAMES_PATH off the event loop."""
+    global _known_names
+    if not settings.SUBREDDIT_NAMES_PATH:
+        return
+    try:
+        _known_names = await asyncio.to_thread(
+            lambda: build_bloom_filter(
+                read_subreddit_names(settings.SUBREDDIT_NAMES_PATH),
+                settings.SUBREDDIT_NAMES_BLOOM_ERROR_RATE,
+            )
+        )
+    except Exception as e:
+        logging.error(e)
+
+
+# Ответы о существовании, известные этому воркеру: имя -> (истекает, существует)
+_local_answers: OrderedDict[str, tuple[float, bool]] = OrderedDict()
+
+
+def _local_get(key: str) -> Optional[bool]:
+    entry = _local_answers.get(key)
+    if entry is None:
+        return None
+    expires_at, exists = entry
+    if expires_at <= time.time():
+        del _local_answers[key]
+        return None
+    _local_answers.move_to_end(key)
+    return exists
+
+
+def _local_put(key: str, exists: bool, ttl: int) -> None:
+    if settings.SUBREDDIT_EXISTENCE_LOCAL_SIZE <= 0:
+        return
+    _local_answers[key] = (time.time() + ttl, exists)
+    _local_answers.move_to_end(key)
+    while len(_local_answers) > settings.SUBREDDIT_EXISTENCE_LOCAL_SIZE:
+        _local_answers.popitem(last=False)
+
+
+def _ttl(exists: bool) -> int:
+    return settings.SUBREDDIT_EXISTS_TTL if exists else settings.SUBREDDIT_MISSING_TTL
+
+
+def _answer(source: str, exists: bool) -> bool:
+    SUBREDDIT_EXISTENCE_CHECKS.labels(source=source, result="exists" if exists else "missing").inc()
+    return exists
+
+
+def _in_catalog(key: str) -> bool:
+    catalog = get_subreddit_catalog()
+    return (catalog is not None and catalog.get(key) is not None) or get_subreddit_metadata(key) is not None
+
+
+def _rejected_by_names(key: str) -> bool:
+    # Полный список имён считается исчерпывающим: чего в нём нет, того нет и в Reddit
+    return (
+        _known_names is not None
+        and settings.SUBREDDIT_NAMES_AUTHORITATIVE
+        and key not in _known_names
+        and not _in_catalog(key)
+    )
+
+
+def known_missing(subreddit_name: str) -> bool:
+    """
+    True when the name is malformed, this worker recently saw Reddit reject it,
+    or an authoritative list of names doesn't have it; never does I/O.
+    """
+    if not is_valid_subreddit_name(subreddit_name):
+        return True
+    key = subreddit_name.lower()
+    exists = _local_get(key)
+    if exists is not None:
+        return not exists
+    return _rejected_by_names(key)
+
+
+async def remember_subreddit(subreddit_name: str, exists: bool) -> None:
+    key = subreddit_name.lower()
+    _local_put(key, exists, _ttl(exists))
+    try:
+        await redis.setex(f"{EXISTS_KEY_PREFIX}{key}", _ttl(exists), "1" if exists else "0")
+    except Exception as e:
+        logging.error(e)
+
+
+async def check_subreddit_exists(
+    subreddit_name: str,
+    probe: Callable[[str], Awaitable[Optional[bool]]],
+) -> bool:
+    """
+    Проверяет, существует ли сабреддит, обращаясь к Reddit только если ответа нет ни в одном кеше.
+    Порядок: синтаксис имени, память воркера, каталог и снимок в mmap, фильтр Блума известных имён,
+    Redis и только затем Reddit. Если фильтр загружен и SUBREDDIT_NAMES_AUTHORITATIVE, имя не из фильтра
+    отклоняется сразу, и Reddit не спрашивается. Отрицательные ответы Reddit живут SUBREDDIT_MISSING_TTL,
+    положительные — SUBREDDIT_EXISTS_TTL.
+    Args:
+        subreddit_name: название сабреддита.
+        probe: корутина, спрашивающая Reddit; возвращает None, если ответ получить не удалось.
+    Returns:
+        False, если сабреддита точно нет; при недоступности Reddit — True, чтобы не отклонять настоящие имена.
+    """
+    if not is_valid_subreddit_name(subreddit_name):
+        return _answer("syntax", False)
+
+    key = subreddit_name.lower()
+    exists = _local_get(key)
+    if exists is not None:
+        return _answer("local", exists)
+
+    if _in_catalog(key):
+        _local_put(key, True, settings.SUBREDDIT_EXISTS_TTL)
+        return _answer("catalog", True)
+
+    if _known_names is not None:
+        if key in _known_names:
+            return _answer("bloom", True)
+        if settings.SUBREDDIT_NAMES_AUTHORITATIVE:
+            return _answer("bloom", False)
+
+    try:
+        cached = await redis.get(f"{EXISTS_KEY_PREFIX}{key}")
+    except Exception as e:
+        logging.error(e)
+        cached = None
+    if cached is not None:
+        exists = cached == "1"
+        _local_put(key, exists, _ttl(exists))
+        return _answer("redis", exists)
+
+    exists = await probe(subreddit_name)
+    if exists is None:
+        return _answer("unknown", True)
+    await remember_subreddit(subreddit_name, exists)
+    return _answer("reddit", exists)
@@ -0,0 +1,75 @@
+from core.config import settings
+from database.redis import redis
+from services.reddit.cache import RULES_KEY_PREFIX
+from services.reddit.catalog import get_subreddit_catalog
+from services.reddit.metadata_store import SubredditRecord, write_metadata_store
+from typing import Optional
+import asyncio
+import json
+import logging
+import socket
+
+
+REFRESH_LOCK_PREFIX = "subreddit_metadata_store_lock:"
+
+
+async def _cached_rules() -> dict[str, tuple[float, str]]:
+    """Successful rules currently in the Redis cache, with the time they were fetched."""
+    rules = {}
+    async for key in redis.scan_iter(match=f"{RULES_KEY_PREFIX}*", count=1000):
+        raw = await redis.get(key)
+        if not raw:
+            continue
+        try:
+            entry = json.loads(raw)
+            data = json.loads(entry["rules"])
+        except (ValueError, KeyError, TypeError):
+            continue
+        if data.get("status") == "success":
+            fetched_at = entry["fresh_until"] - settings.SUBREDDIT_RULES_CACHE_TTL
+            rules[data["name"].lower()] = (fetched_at, entry["rules"])
+    return rules
+
+
+async def build_metadata_store() -> int:
+    """Snapshots the catalog and the cached rules into SUBREDDIT_METADATA_STORE_PATH."""
+    cached = await _cached_rules()
+    catalog = get_subreddit_catalog()
+    records = []
+    for entry in catalog.entries if catalog is not None else []:
+        fetched_at, rules = cached.pop(entry.name.lower(), (0.0, None))
+        records.append(SubredditRecord(entry.name, entry.subscribers, fetched_at, rules))
+    for fetched_at, rules in cached.values():
+        data = json.loads(rules)
+        records.append(SubredditRecord(data["name"], int(data.get("subscribers") or 0), fetched_at, rules))
+    return await asyncio.to_thread(write_metadata_store, settings.SUBREDDIT_METADATA_STORE_PATH, records)
+
+
+async def _refresh_periodically() -> None:
+    # Файл общий для воркеров одной машины, поэтому перестраивает его один воркер на хост
+    lock_key = f"{REFRESH_LOCK_PREFIX}{socket.gethostname()}"
+    while True:
+        try:
+            if await redis.set(lock_key, "1", nx=True, ex=settings.SUBREDDIT_METADATA_STORE_REFRESH_INTERVAL):
+                count = await build_metadata_store()
+                logging.info(f"Subreddit metadata store rebuilt with {count} records")
+        except Exception as e:
+            logging.error(e)
+        await asyncio.sleep(settings.SUBREDDIT_METADATA_STORE_REFRESH_INTERVAL)
+
+
+_refresh_task: Optional[asyncio.Task] = None
+
+
+async def start_metadata_store() -> None:
+    global _refresh_task
+    if settings.SUBREDDIT_METADATA_STORE_PATH and _refresh_task is None:
+        _refresh_task = asyncio.create_task(_refresh_periodically())
+
+
+async def close_metadata_store() -> None:
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        await asyncio.gather(_refresh_task, return_exceptions=True)
+        _refresh_task = None
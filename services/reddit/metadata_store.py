@@ -0,0 +1,137 @@
+from core.config import settings
+from dataclasses import dataclass
+from typing import Iterable, Optional
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import time
+
+
+# Файл: заголовок, записи подряд, затем индекс (хеш имени, смещение записи), отсортированный по хешу.
+# Поиск — бинарный по индексу прямо в mmap, без разбора всего файла в объекты Python.
+MAGIC = b"SRMS"
+VERSION = 1
+_HEADER = struct.Struct("<4sIIQd")
+_RECORD = struct.Struct("<QdHI")
+_INDEX_ENTRY = struct.Struct("<QQ")
+
+
+@dataclass
+class SubredditRecord:
+    name: str
+    subscribers: int
+    # Когда были получены правила; 0, если правил в снимке нет
+    fetched_at: float
+    rules: Optional[str]
+
+
+def _name_hash(name: str) -> int:
+    return int.from_bytes(hashlib.blake2b(name.lower().encode(), digest_size=8).digest(), "little")
+
+
+def write_metadata_store(path: str, records: Iterable[SubredditRecord]) -> int:
+    """Writes a snapshot to a temporary file and atomically replaces path with it. Returns the record count."""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    index = []
+    with open(temporary, "wb") as file:
+        file.write(b"\0" * _HEADER.size)
+        seen = set()
+        for record in records:
+            key = record.name.lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            name = record.name.encode()
+            rules = (record.rules or "").encode()
+            index.append((_name_hash(record.name), file.tell()))
+            file.write(_RECORD.pack(record.subscribers, record.fetched_at, len(name), len(rules)))
+            file.write(name)
+            file.write(rules)
+        index_offset = file.tell()
+        index.sort()
+        for entry in index:
+            file.write(_INDEX_ENTRY.pack(*entry))
+        file.seek(0)
+        file.write(_HEADER.pack(MAGIC, VERSION, len(index), index_offset, time.time()))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+    return len(index)
+
+
+class MetadataStore:
+    """Read-only view of a snapshot file; the mapping is shared with every other worker on the host."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self.inode = os.fstat(file.fileno()).st_ino
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, self._index_offset, self.built_at = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f"Unsupported metadata store {path}")
+
+    def _hash_at(self, position: int) -> int:
+        return _INDEX_ENTRY.unpack_from(self._map, self._index_offset + position * _INDEX_ENTRY.size)[0]
+
+    def _record(self, offset: int) -> SubredditRecord:
+        subscribers, fetched_at, name_length, rules_length = _RECORD.unpack_from(self._map, offset)
+        start = offset + _RECORD.size
+        name = self._map[start:start + name_length].decode()
+        rules = self._map[start + name_length:start + name_length + rules_length].decode()
+        return SubredditRecord(name, subscribers, fetched_at, rules or None)
+
+    def get(self, name: str) -> Optional[SubredditRecord]:
+        target = _name_hash(name)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._hash_at(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        key = name.lower()
+        while low < self.count and self._hash_at(low) == target:
+            offset = _INDEX_ENTRY.unpack_from(self._map, self._index_offset + low * _INDEX_ENTRY.size)[1]
+            record = self._record(offset)
+            if record.name.lower() == key:
+                return record
+            low += 1
+        return None
+
+    def close(self) -> None:
+        self._map.close()
+
+
+_store: Optional[MetadataStore] = None
+_checked_at = 0.0
+
+
+def _current_store() -> Optional[MetadataStore]:
+    """Reopens the snapshot at most every SUBREDDIT_METADATA_STORE_CHECK_INTERVAL once the file was replaced."""
+    global _store, _checked_at
+    path = settings.SUBREDDIT_METADATA_STORE_PATH
+    if not path:
+        return None
+    now = time.monotonic()
+    if now - _checked_at < settings.SUBREDDIT_METADATA_STORE_CHECK_INTERVAL:
+        return _store
+    _checked_at = now
+    try:
+        inode = os.stat(path).st_ino
+        if _store is None or _store.inode != inode:
+            # Старое отображение закроет GC, когда его перестанут читать
+            _store = MetadataStore(path)
+    except (OSError, ValueError) as e:
+        if _store is None:
+            logging.debug(e)
+    return _store
+
+
+def get_subreddit_metadata(name: str) -> Optional[SubredditRecord]:
+    store = _current_store()
+    if store is None:
+        return None
+    return store.get(name)
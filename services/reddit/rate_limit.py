@@ -0,0 +1,164 @@
+from core.config import settings
+from database.redis import redis
+from services.metrics.metrics import (
+    REDDIT_RATELIMIT_REMAINING,
+    REDDIT_RATELIMIT_USED,
+    REDDIT_RATELIMIT_RESET_SECONDS,
+    REDDIT_RATELIMIT_WAIT_SECONDS,
+    REDDIT_RATELIMIT_REJECTED,
+    REDDIT_RATELIMIT_THROTTLED,
+)
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Mapping, Optional
+import asyncio
+import logging
+import time
+
+
+RATELIMIT_KEY = "reddit_ratelimit"
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Приоритет запросов к Reddit из текущей задачи; фоновые задачи выставляют BACKGROUND
+_priority: ContextVar[str] = ContextVar("reddit_priority", default=INTERACTIVE)
+
+_NOW = """
+local t = redis.call('time')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+"""
+
+# ARGV: rate per second, burst, reserve (share of the budget kept for interactive requests)
+# Returns 0 when a token was taken, otherwise seconds to wait before trying again.
+_ACQUIRE_SCRIPT = _NOW + """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local reserve = tonumber(ARGV[3])
+local state = redis.call('hmget', KEYS[1], 'tokens', 'updated_at', 'remaining', 'used', 'reset_at')
+local tokens = tonumber(state[1]) or burst
+local updated_at = tonumber(state[2]) or now
+local remaining = tonumber(state[3])
+local used = tonumber(state[4]) or 0
+local reset_at = tonumber(state[5])
+
+if remaining and reset_at and now < reset_at then
+    -- Reddit's window: never dip into the interactive reserve and spread the rest until the reset
+    local left = remaining - reserve * (remaining + used)
+    if left < 1 then
+        return tostring(reset_at - now)
+    end
+    rate = math.min(rate, left / (reset_at - now))
+else
+    remaining = nil
+end
+
+tokens = math.min(burst, tokens + (now - updated_at) * rate)
+local needed = 1 + reserve * burst
+if tokens < needed then
+    redis.call('hset', KEYS[1], 'tokens', tokens, 'updated_at', now)
+    return tostring((needed - tokens) / rate)
+end
+redis.call('hset', KEYS[1], 'tokens', tokens - 1, 'updated_at', now)
+if remaining then
+    -- Списываем сразу, не дожидаясь заголовков ответа, чтобы параллельные воркеры не перерасходовали окно
+    redis.call('hset', KEYS[1], 'remaining', remaining - 1, 'used', used + 1)
+end
+return '0'
+"""
+
+# ARGV: remaining, used, seconds to reset
+_UPDATE_SCRIPT = _NOW + """
+local remaining = tonumber(ARGV[1])
+local used = tonumber(ARGV[2])
+local reset_at = now + tonumber(ARGV[3])
+local known_reset_at = tonumber(redis.call('hget', KEYS[1], 'reset_at'))
+if known_reset_at and now < known_reset_at and math.abs(reset_at - known_reset_at) < 2 then
+    -- Same window: responses arrive out of order, so trust the smallest remaining budget
+    remaining = math.min(remaining, tonumber(redis.call('hget', KEYS[1], 'remaining')) or remaining)
+    used = math.max(used, tonumber(redis.call('hget', KEYS[1], 'used')) or used)
+end
+redis.call('hset', KEYS[1], 'remaining', remaining, 'used', used, 'reset_at', reset_at)
+redis.call('expire', KEYS[1], math.ceil(tonumber(ARGV[3])) + 60)
+return 1
+"""
+
+
+class RedditBudgetExhausted(Exception):
+    """Reddit's request budget would not allow this request within REDDIT_RATE_LIMIT_MAX_WAIT."""
+
+
+@contextmanager
+def reddit_priority(priority: str) -> Iterator[None]:
+    """Requests made in this block, including by tasks created in it, use the given priority."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def _reserve(priority: str) -> float:
+    return settings.REDDIT_RATE_LIMIT_BACKGROUND_RESERVE if priority == BACKGROUND else 0.0
+
+
+async def acquire_reddit_request() -> None:
+    """
+    Ждёт разрешения на запрос к Reddit по общему для всех воркеров бюджету в Redis.
+    Токены пополняются со скоростью REDDIT_RATE_LIMIT_PER_MINUTE, но не быстрее, чем позволяет
+    остаток окна из заголовков X-Ratelimit-*. Фоновым запросам недоступна доля бюджета
+    REDDIT_RATE_LIMIT_BACKGROUND_RESERVE, она остаётся интерактивным. Если Redis недоступен, запрос разрешается.
+    Raises:
+        RedditBudgetExhausted: если ждать пришлось бы дольше REDDIT_RATE_LIMIT_MAX_WAIT.
+    """
+    priority = _priority.get()
+    deadline = time.monotonic() + settings.REDDIT_RATE_LIMIT_MAX_WAIT
+    started = time.monotonic()
+    while True:
+        try:
+            wait = float(await redis.eval(
+                _ACQUIRE_SCRIPT, 1, RATELIMIT_KEY,
+                settings.REDDIT_RATE_LIMIT_PER_MINUTE / 60,
+                settings.REDDIT_RATE_LIMIT_BURST,
+                _reserve(priority),
+            ))
+        except Exception as e:
+            logging.error(e)
+            return
+        if wait <= 0:
+            REDDIT_RATELIMIT_WAIT_SECONDS.labels(priority=priority).observe(time.monotonic() - started)
+            return
+        if time.monotonic() + wait > deadline:
+            REDDIT_RATELIMIT_REJECTED.labels(priority=priority).inc()
+            raise RedditBudgetExhausted(f"Reddit rate limit: next {priority} request in {wait:.1f}s")
+        await asyncio.sleep(wait)
+
+
+def _header(headers: Mapping[str, str], name: str) -> Optional[float]:
+    value = headers.get(name) or headers.get(name.lower())
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+async def update_reddit_budget(headers: Mapping[str, str], status: int) -> None:
+    """Records the budget Reddit reported in a response; a 429 empties the window until its reset."""
+    remaining = _header(headers, "X-Ratelimit-Remaining")
+    used = _header(headers, "X-Ratelimit-Used")
+    reset = _header(headers, "X-Ratelimit-Reset")
+    if status == 429:
+        REDDIT_RATELIMIT_THROTTLED.inc()
+        remaining = 0.0
+        if reset is None:
+            reset = _header(headers, "Retry-After") or 60.0
+    if remaining is None or reset is None:
+        return
+    used = used or 0.0
+    REDDIT_RATELIMIT_REMAINING.set(remaining)
+    REDDIT_RATELIMIT_USED.set(used)
+    REDDIT_RATELIMIT_RESET_SECONDS.set(reset)
+    try:
+        await redis.eval(_UPDATE_SCRIPT, 1, RATELIMIT_KEY, remaining, used, reset)
+    except Exception as e:
+        logging.error(e)
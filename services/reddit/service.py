@@ -3,6 +3,7 @@ import json
 import logging
 from typing import List, Dict, Any
 from core.config import settings
+from services.reddit.rate_limit import acquire_reddit_request, update_reddit_budget
 import base64
 
 class Reddit:
@@ -45,6 +46,13 @@ class Reddit:
     async def subreddit(self, subreddit_name: str):
         return Subreddit(self, subreddit_name)
 
+    async def get(self, path: str):
+        """GET against the API within the rate-limit budget shared by all workers."""
+        await acquire_reddit_request()
+        response = await self.session.get(f"{self.base_url}{path}")
+        await update_reddit_budget(response.headers, response.status)
+        return response
+
 class Subreddit:
     def __init__(self, reddit: Reddit, name: str):
         self.reddit = reddit
@@ -52,7 +60,7 @@ class Subreddit:
         self.subscribers = None
 
     async def load(self):
-        async with self.reddit.session.get(f"{self.reddit.base_url}/r/{self.name}/about") as response:
+        async with await self.reddit.get(f"/r/{self.name}/about") as response:
             if response.status == 200:
                 data = await response.json()
                 self.subscribers = data["data"]["subscribers"]
@@ -61,7 +69,7 @@ class Subreddit:
 
     @property
     async def rules(self):
-        async with self.reddit.session.get(f"{self.reddit.base_url}/r/{self.name}/about/rules") as response:
+        async with await self.reddit.get(f"/r/{self.name}/about/rules") as response:
             if response.status == 200:
                 data = await response.json()
                 for rule in data["rules"]:
@@ -1,63 +1,170 @@
 from core.config import settings
+from services.reddit.cache import get_or_load_subreddit_rules
+from services.reddit.existence import check_subreddit_exists, known_missing, remember_subreddit
+from services.reddit.rate_limit import RedditBudgetExhausted, acquire_reddit_request, update_reddit_budget
+from services.resilience.circuit_breaker import get_circuit_breaker, backoff_delay
+from services.metrics.metrics import UPSTREAM_RETRIES
+from asyncprawcore import Requestor
+from asyncprawcore.exceptions import BadRequest, Forbidden, NotFound, Redirect, TooManyRequests
+from typing import Optional
+import asyncio
 import asyncpraw
 import json
 import logging
 
+
+class GovernedRequestor(Requestor):
+    """
+    Requestor that spends the rate-limit budget shared by all workers on every API request.
+    Written for asyncprawcore 2.x, where request is a coroutine returning the response;
+    from 3.0 it is an async context manager, so requirements/prod.txt pins asyncprawcore<3.
+    """
+
+    async def request(self, method, url, *args, timeout=None, **kwargs):
+        # method и url — первые аргументы aiohttp.ClientSession.request, которому Requestor их передаёт.
+        # Получение токена OAuth идёт на reddit_url и в бюджет API не входит
+        governed = str(url).startswith(self.oauth_url)
+        if governed:
+            await acquire_reddit_request()
+        response = await super().request(method, url, *args, timeout=timeout, **kwargs)
+        if governed:
+            await update_reddit_budget(response.headers, response.status)
+        return response
+
+
 reddit = asyncpraw.Reddit(
     client_id=settings.REDDIT_CLIENT_ID,
     client_secret=settings.REDDIT_CLIENT_SECRET,
     user_agent=settings.REDDIT_USER_AGENT,
     username=settings.REDDIT_USER_NAME,
     password=settings.REDDIT_USER_PASSWORD,
+    requestor_class=GovernedRequestor,
 )
 
+reddit_breaker = get_circuit_breaker("reddit")
 
-async def subreddit_exists(subreddit_name: str) -> bool:
+# Ошибки из-за самого сабреддита (нет такого, приватный, кривое имя) — Reddit при этом здоров
+_SUBREDDIT_ERRORS = (BadRequest, Forbidden, NotFound, Redirect)
+
+
+async def _probe_subreddit(subreddit_name: str) -> Optional[bool]:
+    # Без fetch=True asyncpraw создаёт ленивый объект и ничего не проверяет
+    if not await reddit_breaker.allow():
+        return None
     try:
-        await reddit.subreddit(subreddit_name)
+        await reddit.subreddit(subreddit_name, fetch=True)
+    except (BadRequest, NotFound, Redirect):
+        await reddit_breaker.record_success()
+        return False
+    except Forbidden:
+        # Приватный или закрытый на карантин, но существует
+        await reddit_breaker.record_success()
         return True
+    except RedditBudgetExhausted as e:
+        logging.warning(e)
+        return None
     except Exception as e:
         logging.error(e)
-        return False
+        await reddit_breaker.record_failure()
+        return None
+    await reddit_breaker.record_success()
+    return True
+
+
+async def subreddit_exists(subreddit_name: str) -> bool:
+    return await check_subreddit_exists(subreddit_name, _probe_subreddit)
 
 
 async def get_subreddit_rules(subreddit_name: str):
     """
-    Получает правила для списка сабреддитов.
+    Получает правила сабреддита через кеш в Redis.
     Args:
         subreddit_name: название сабреддита.
     Returns:
         JSON-объект с правилами для сабреддита.
     """
-    try:
-        subreddit = await reddit.subreddit(subreddit_name)
-        subreddit_rules = []
-        async for rule in subreddit.rules:
-            subreddit_rules.append(rule)
-
-        rule_list = [
-            {
-                "rule_number": idx + 1,
-                "short_name": rule.short_name,
-                "description": rule.description,
-            }
-            for idx, rule in enumerate(subreddit_rules)
-        ]
-        await subreddit.load()
-        
-        return json.dumps({
-            "name": subreddit_name,
-            "subscribers": subreddit.subscribers,
-            "status": "success",
-            "rules": rule_list
-        })
-        
-    except Exception as e:
-        logging.error(e)
-        return json.dumps({
-            "name": subreddit_name,
-            "status": "failed",
-        })
+    if known_missing(subreddit_name):
+        return _failed_rules(subreddit_name)
+    return await get_or_load_subreddit_rules(subreddit_name, fetch_subreddit_rules)
+
+
+def _failed_rules(subreddit_name: str) -> str:
+    return json.dumps({
+        "name": subreddit_name,
+        "status": "failed",
+    })
+
+
+async def _load_subreddit_rules(subreddit_name: str) -> str:
+    subreddit = await reddit.subreddit(subreddit_name)
+    subreddit_rules = []
+    async for rule in subreddit.rules:
+        subreddit_rules.append(rule)
+
+    rule_list = [
+        {
+            "rule_number": idx + 1,
+            "short_name": rule.short_name,
+            "description": rule.description,
+        }
+        for idx, rule in enumerate(subreddit_rules)
+    ]
+    await subreddit.load()
+    
+    return json.dumps({
+        "name": subreddit_name,
+        "subscribers": subreddit.subscribers,
+        "status": "success",
+        "rules": rule_list
+    })
+
+
+async def fetch_subreddit_rules(subreddit_name: str):
+    """
+    Получает правила сабреддита напрямую из Reddit.
+    Сбои Reddit повторяются с джиттером, пока это позволяет circuit breaker,
+    а при открытом контуре запрос сразу завершается неудачей.
+    Запросы расходуют общий для воркеров бюджет Reddit; если его не хватает, правила не загружаются.
+    Args:
+        subreddit_name: название сабреддита.
+    Returns:
+        JSON-объект с правилами для сабреддита.
+    """
+    if not await reddit_breaker.allow():
+        return _failed_rules(subreddit_name)
+
+    attempt = 1
+    while True:
+        try:
+            rules = await _load_subreddit_rules(subreddit_name)
+            await reddit_breaker.record_success()
+            await remember_subreddit(subreddit_name, True)
+            return rules
+        except _SUBREDDIT_ERRORS as e:
+            logging.error(e)
+            await reddit_breaker.record_success()
+            if not isinstance(e, Forbidden):
+                await remember_subreddit(subreddit_name, False)
+            return _failed_rules(subreddit_name)
+        except RedditBudgetExhausted as e:
+            # Reddit здоров, просто бюджет запросов на исходе — контур не трогаем
+            logging.warning(e)
+            return _failed_rules(subreddit_name)
+        except TooManyRequests as e:
+            logging.warning(e)
+            if attempt >= settings.UPSTREAM_RETRY_ATTEMPTS:
+                return _failed_rules(subreddit_name)
+            # Следующая попытка дождётся сброса окна в acquire_reddit_request
+            attempt += 1
+            continue
+        except Exception as e:
+            logging.error(e)
+            await reddit_breaker.record_failure()
+            if attempt >= settings.UPSTREAM_RETRY_ATTEMPTS or not await reddit_breaker.allow():
+                return _failed_rules(subreddit_name)
+            UPSTREAM_RETRIES.labels(upstream=reddit_breaker.name).inc()
+            await asyncio.sleep(backoff_delay(attempt))
+            attempt += 1
 
 # async def get_reddit_access_token() -> str:
 #     async with httpx.AsyncClient() as client:
@@ -0,0 +1,120 @@
+from core.config import settings
+from database.redis import redis
+from services.metrics.metrics import CIRCUIT_REJECTED
+import logging
+import random
+
+
+CIRCUIT_KEY_PREFIX = "circuit:"
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_NOW = """
+local t = redis.call('time')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+"""
+
+# ARGV: reset_timeout, probe_timeout
+_ALLOW_SCRIPT = _NOW + """
+local state = redis.call('hget', KEYS[1], 'state')
+if not state or state == 'closed' then
+    return 1
+end
+if state == 'open' then
+    local opened_at = tonumber(redis.call('hget', KEYS[1], 'opened_at') or '0')
+    if now - opened_at < tonumber(ARGV[1]) then
+        return 0
+    end
+    redis.call('hset', KEYS[1], 'state', 'half_open', 'probe_until', now + tonumber(ARGV[2]))
+    return 1
+end
+-- half_open: one probe at a time, another one only if the previous probe got lost
+local probe_until = tonumber(redis.call('hget', KEYS[1], 'probe_until') or '0')
+if now >= probe_until then
+    redis.call('hset', KEYS[1], 'probe_until', now + tonumber(ARGV[2]))
+    return 1
+end
+return 0
+"""
+
+# ARGV: failure_threshold
+_FAILURE_SCRIPT = _NOW + """
+local failures = redis.call('hincrby', KEYS[1], 'failures', 1)
+local state = redis.call('hget', KEYS[1], 'state')
+if state == 'half_open' or (state ~= 'open' and failures >= tonumber(ARGV[1])) then
+    redis.call('hset', KEYS[1], 'state', 'open', 'opened_at', now)
+    return 1
+end
+return 0
+"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for one upstream, with its state kept in Redis so all workers share it.
+
+    After CIRCUIT_FAILURE_THRESHOLD consecutive failures the circuit opens and calls fail fast.
+    After CIRCUIT_RESET_TIMEOUT a single half-open probe is let through: its success closes
+    the circuit, its failure opens it again. If Redis is unavailable calls are allowed.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._key = f"{CIRCUIT_KEY_PREFIX}{name}"
+
+    async def allow(self) -> bool:
+        try:
+            allowed = bool(await redis.eval(
+                _ALLOW_SCRIPT, 1, self._key,
+                settings.CIRCUIT_RESET_TIMEOUT, settings.CIRCUIT_PROBE_TIMEOUT,
+            ))
+        except Exception as e:
+            logging.error(e)
+            return True
+        if not allowed:
+            CIRCUIT_REJECTED.labels(upstream=self.name).inc()
+        return allowed
+
+    async def record_success(self) -> None:
+        try:
+            await redis.hset(self._key, mapping={"state": CLOSED, "failures": 0})
+        except Exception as e:
+            logging.error(e)
+
+    async def record_failure(self) -> None:
+        try:
+            opened = await redis.eval(_FAILURE_SCRIPT, 1, self._key, settings.CIRCUIT_FAILURE_THRESHOLD)
+        except Exception as e:
+            logging.error(e)
+            return
+        if opened:
+            logging.warning(f"Circuit for {self.name} is open")
+
+    async def status(self) -> dict:
+        data = await redis.hgetall(self._key)
+        return {
+            "state": data.get("state", CLOSED),
+            "failures": int(data.get("failures", 0)),
+            "opened_at": float(data["opened_at"]) if "opened_at" in data else None,
+        }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name)
+    return _breakers[name]
+
+
+def registered_circuit_breakers() -> list[CircuitBreaker]:
+    return list(_breakers.values())
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given retry attempt, starting at 1."""
+    ceiling = min(settings.UPSTREAM_RETRY_MAX_DELAY, settings.UPSTREAM_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+    return random.uniform(0, ceiling)
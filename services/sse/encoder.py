@@ -0,0 +1,157 @@
+from core.config import settings
+from dataclasses import dataclass
+from services.ai.admission import is_queue_event
+from typing import AsyncGenerator
+import asyncio
+import json
+import re
+
+
+TOKEN = "token"
+SUGGESTION = "suggestion"
+RULES = "rules"
+QUEUE = "queue"
+ERROR = "error"
+DONE_AI = "done_ai"
+DONE = "done"
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # Не даём nginx буферизовать поток
+    "X-Accel-Buffering": "no",
+}
+
+HEARTBEAT = ": ping\n\n"
+
+_LINE_BREAK = re.compile(r"\r\n|\r|\n")
+
+
+@dataclass
+class SSEEvent:
+    event: str
+    data: str
+    # Метка подпотока, когда в одном SSE идут ответы на несколько запросов
+    stream: int | str | None = None
+
+
+def format_event(
+    event: str,
+    data: str,
+    event_id: int | str | None = None,
+    stream: int | str | None = None,
+) -> str:
+    """
+    Frames one event; multi-line data becomes several data: lines as the SSE spec requires.
+    Events of a multiplexed stream carry {"stream": ..., "data": ...} as their data.
+    """
+    if stream is not None:
+        data = json.dumps({"stream": stream, "data": data})
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.extend(f"data: {line}" for line in _LINE_BREAK.split(data))
+    return "\n".join(lines) + "\n\n"
+
+
+def model_chunk_event(chunk: str) -> SSEEvent:
+    """Maps a chunk of a model stream (stream_model_response and friends) to its event."""
+    if is_queue_event(chunk):
+        return SSEEvent(QUEUE, chunk.split("data: ", 1)[1].strip())
+    if chunk.startswith("Error:"):
+        return SSEEvent(ERROR, chunk)
+    if chunk == "[DONE]":
+        return SSEEvent(DONE, chunk)
+    return SSEEvent(TOKEN, chunk)
+
+
+async def model_events(stream: AsyncGenerator[str, None]) -> AsyncGenerator[SSEEvent, None]:
+    try:
+        async for chunk in stream:
+            yield model_chunk_event(chunk)
+    finally:
+        await stream.aclose()
+
+
+_END = object()
+
+
+async def encode_sse(
+    events: AsyncGenerator[SSEEvent, None],
+    first_id: int = 1,
+) -> AsyncGenerator[str, None]:
+    """
+    Frames events as SSE with increasing ids. Consecutive token events are coalesced
+    into one frame until SSE_FLUSH_BYTES are buffered or SSE_FLUSH_INTERVAL has passed
+    since the first buffered token (tokens of different streams are never merged), and a heartbeat
+    comment is sent after SSE_HEARTBEAT_INTERVAL without output so proxies keep the connection open.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=16)
+
+    async def produce():
+        try:
+            async for event in events:
+                await queue.put(event)
+        finally:
+            await events.aclose()
+        await queue.put(_END)
+
+    producer = asyncio.create_task(produce())
+    loop = asyncio.get_running_loop()
+    event_id = first_id
+    buffer: list[str] = []
+    buffer_stream = None
+    buffered_bytes = 0
+    flush_at = None
+    last_output = loop.time()
+
+    def flush() -> str:
+        nonlocal event_id, buffered_bytes, flush_at, last_output
+        frame = format_event(TOKEN, "".join(buffer), event_id, buffer_stream)
+        event_id += 1
+        buffer.clear()
+        buffered_bytes = 0
+        flush_at = None
+        last_output = loop.time()
+        return frame
+
+    try:
+        while True:
+            deadline = flush_at if flush_at is not None else last_output + settings.SSE_HEARTBEAT_INTERVAL
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                if producer.done() and queue.empty():
+                    producer.result()
+                    item = _END
+                elif buffer:
+                    yield flush()
+                    continue
+                else:
+                    last_output = loop.time()
+                    yield HEARTBEAT
+                    continue
+
+            if item is _END:
+                if buffer:
+                    yield flush()
+                return
+
+            if item.event == TOKEN:
+                if buffer and item.stream != buffer_stream:
+                    yield flush()
+                buffer_stream = item.stream
+                buffer.append(item.data)
+                buffered_bytes += len(item.data.encode())
+                if flush_at is None:
+                    flush_at = loop.time() + settings.SSE_FLUSH_INTERVAL
+                if buffered_bytes >= settings.SSE_FLUSH_BYTES:
+                    yield flush()
+                continue
+
+            if buffer:
+                yield flush()
+            yield format_event(item.event, item.data, event_id, item.stream)
+            event_id += 1
+            last_output = loop.time()
+    finally:
+        producer.cancel()
@@ -0,0 +1,61 @@
+from services.ai import prompts
+from services.ai.prompt_budget import count_tokens
+from services.errors.ai_errors import PostTooLong
+import json
+import pytest
+
+
+RULES = json.dumps({
+    "name": "test",
+    "status": "success",
+    "rules": [
+        {"rule_number": 1, "short_name": "No spam", "description": "Do not post links to your own products."},
+        {"rule_number": 2, "short_name": "Use flair", "description": "Every post needs a flair."},
+    ],
+})
+
+
+WORDS = "titles bodies flair links images videos memes questions answers sources".split()
+
+
+def _budget_with_room(room: int) -> int:
+    return count_tokens(prompts.FORMAT_POST_INSTRUCTIONS) + room
+
+
+def test_format_prompt_rejects_post_that_leaves_no_room_for_rules(monkeypatch):
+    monkeypatch.setattr(prompts, "prompt_token_budget", lambda: _budget_with_room(300))
+    post = "Long story about my weekend project. " * 500
+
+    with pytest.raises(PostTooLong):
+        prompts.create_format_post_for_subreddit_prompt(post, "test", RULES)
+
+
+def test_format_prompt_keeps_long_post_whole_and_shortens_rules(monkeypatch):
+    budget = _budget_with_room(600)
+    monkeypatch.setattr(prompts, "prompt_token_budget", lambda: budget)
+    rules = json.dumps({
+        "name": "test",
+        "status": "success",
+        "rules": [
+            {"rule_number": number, "short_name": f"Rule {number}", "description": " ".join(f"{word}{number}{i}" for i in range(8) for word in WORDS)}
+            for number in range(1, 11)
+        ],
+    })
+    post = "Story about my weekend project. " * 20
+
+    prompt = prompts.create_format_post_for_subreddit_prompt(post, "test", rules)
+
+    assert post in prompt
+    assert "Rule 1" in prompt
+    assert "sources107" not in prompt
+    assert count_tokens(prompt) <= budget + 10
+
+
+def test_format_prompt_keeps_short_post_whole(monkeypatch):
+    monkeypatch.setattr(prompts, "prompt_token_budget", lambda: _budget_with_room(300))
+    post = "Short post about my weekend project."
+
+    prompt = prompts.create_format_post_for_subreddit_prompt(post, "test", RULES)
+
+    assert post in prompt
+    assert "No spam" in prompt
@@ -0,0 +1,63 @@
+from services.ai.rule_checks import check_post
+import json
+
+
+def _rules(*rules: tuple[str, str]) -> str:
+    return json.dumps({
+        "name": "test",
+        "status": "success",
+        "rules": [
+            {"rule_number": number, "short_name": short_name, "description": description}
+            for number, (short_name, description) in enumerate(rules, 1)
+        ],
+    })
+
+
+def test_forbidden_tag_is_not_added():
+    rules = _rules(("No NSFW tag", "Titles must not start with [NSFW]."))
+
+    report = check_post("[NSFW] My cat\n\nPhotos of my cat.", rules)
+
+    assert not report.compliant
+    assert not report.title.startswith("[NSFW] [NSFW]")
+    assert report.score < 1.0
+
+
+def test_required_tag_is_added():
+    rules = _rules(("Tag your post", "Titles must start with [Question]."))
+
+    report = check_post("How do I start\n\nI'm new to this.", rules)
+
+    assert report.fixed
+    assert report.title == "[Question] How do I start"
+    assert report.compliant
+    assert report.score == 1.0
+
+
+def test_conduct_wording_keeps_mechanical_checks():
+    rules = _rules(("Title length", "Titles must be at least 20 characters. Respect the formatting guidelines."))
+
+    report = check_post("Hi\n\nSome body text.", rules)
+
+    assert not report.compliant
+    assert report.violations == ["Title length"]
+
+
+def test_conduct_rule_needs_model():
+    rules = _rules(("No links", "No links allowed. Be civil."))
+
+    report = check_post("My project\n\nSee https://example.com for details.", rules)
+
+    assert report.fixed
+    assert "https://example.com" not in report.body
+    assert report.score == 1.0
+    assert not report.compliant
+
+
+def test_not_compliant_below_full_score():
+    rules = _rules(("Title length", "Titles must be at least 20 characters."))
+
+    report = check_post("Hi\n\nSome body text.", rules)
+
+    assert report.score < 1.0
+    assert not report.compliant